@@ -0,0 +1,100 @@
+"""Benchmark: account id allocation with 100k existing accounts.
+
+Compares the old `generate_user_id` (load every account, `len(...) + 4`)
+with letting the database allocate the id inside the signup transaction.
+argon2 is left out, it costs the same either way.
+
+usage: python -m benchmarks.account_creation [existing_accounts]
+"""
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+from sqlmodel import Session, SQLModel, create_engine, insert, select
+
+from database import models
+
+SIGNUPS = 20
+
+
+def old_generate_user_id(database_session: Session) -> int:
+    accounts = database_session.exec(select(models.Account)).all()
+    return len(accounts) + 4
+
+
+def client_detail(user_id: int) -> models.ClientDetail:
+    return models.ClientDetail(
+        user_id=user_id,
+        osu_version=20221230.0,
+        osu_path_md5="",
+        adapters_md5="",
+        uninstall_md5="",
+        disk_signature_md5="",
+        adapters=json.dumps([]),
+        country_code="xx",
+        login_date=time.time(),
+    )
+
+
+def account(user_name: str, user_id: Optional[int] = None) -> models.Account:
+    return models.Account(
+        id=user_id,
+        user_name=user_name,
+        pass_argon2="",
+        friends="[]",
+        country_code="xx",
+        privileges=1,
+    )
+
+
+def main(existing_accounts: int) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{Path(directory) / 'bench.db'}")
+        SQLModel.metadata.create_all(engine)
+
+        with engine.begin() as connection:
+            connection.execute(
+                insert(models.Account),
+                [
+                    {
+                        "user_name": f"user{i}",
+                        "pass_argon2": "",
+                        "friends": "[]",
+                        "country_code": "xx",
+                        "privileges": 1,
+                    }
+                    for i in range(existing_accounts)
+                ],
+            )
+
+        with Session(engine) as database_session:
+            started = time.perf_counter()
+            for i in range(SIGNUPS):
+                user_id = old_generate_user_id(database_session)
+                database_session.add(account(f"old{i}", user_id))
+                database_session.commit()
+                database_session.add(client_detail(user_id))
+                database_session.commit()
+            old = (time.perf_counter() - started) / SIGNUPS
+
+        with Session(engine) as database_session:
+            started = time.perf_counter()
+            for i in range(SIGNUPS):
+                account_model = account(f"new{i}")
+                database_session.add(account_model)
+                database_session.flush()
+                assert account_model.id is not None
+                database_session.add(client_detail(account_model.id))
+                database_session.commit()
+            new = (time.perf_counter() - started) / SIGNUPS
+
+        print(f"{existing_accounts} existing accounts")
+        print(f"old signup: {old * 1000:.2f}ms")
+        print(f"new signup: {new * 1000:.2f}ms")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
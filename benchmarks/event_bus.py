@@ -0,0 +1,130 @@
+"""Benchmark: chat throughput with 1..N worker processes sharing an event broker.
+
+Every worker has `SESSIONS` local sessions in one channel. It encodes and
+publishes its share of the messages, and queues every message (its own and
+those relayed from the other workers) for each of its local sessions, like
+`common.bus.deliver`. Each worker adds its own sessions, and every message
+is delivered in every worker, so messages/s falls as workers are added
+while deliveries/s grows only as far as there are cores. Workers spread
+per-session work, packets and logins, not chat that every session sees.
+
+usage: python -m benchmarks.event_bus [max workers] [messages]
+"""
+import asyncio
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from typing import Optional
+
+import packets
+from objects.event_bus import (
+    EventBroker,
+    EventBus,
+    Topic,
+    UnixSocketBackend,
+    channel_topic,
+)
+
+SESSIONS = 100
+TOPIC = channel_topic("#osu")
+
+
+async def run_worker(
+    worker_id: int,
+    workers: int,
+    messages: int,
+    path: str,
+    start: multiprocessing.Event,
+) -> None:
+    pending_packets = [bytearray() for _ in range(SESSIONS)]
+    delivered = 0
+    done = asyncio.Event()
+
+    def deliver(topic: Topic, data: bytes, excluded_token: Optional[str]) -> None:
+        nonlocal delivered
+
+        for session_packets in pending_packets:
+            session_packets += data
+
+        delivered += 1
+        if delivered == messages:
+            done.set()
+
+        # keep the buffers from growing, clients would have polled by now
+        if delivered % 1000 == 0:
+            for session_packets in pending_packets:
+                session_packets.clear()
+
+    bus = EventBus(deliver, worker_id, UnixSocketBackend(path))
+    await bus.start()
+    await asyncio.to_thread(start.wait)
+
+    for i in range(worker_id, messages, workers):
+        data = packets.send_message(f"user{worker_id}", f"message {i}", "#osu", 1)
+        bus.publish(TOPIC, data)
+
+        if i % 100 == 0:
+            await asyncio.sleep(0)  # let relayed messages in
+
+    await done.wait()
+    await bus.stop()
+
+
+def worker_main(*args) -> None:
+    asyncio.run(run_worker(*args))
+
+
+async def run(workers: int, messages: int) -> float:
+    path = os.path.join(tempfile.gettempdir(), f"bancho-benchmark-{os.getpid()}.sock")
+    if os.path.exists(path):
+        os.remove(path)
+
+    broker = EventBroker(path)
+    await broker.start()
+
+    context = multiprocessing.get_context("spawn")
+    start = context.Event()
+    processes = [
+        context.Process(
+            target=worker_main, args=(worker_id, workers, messages, path, start)
+        )
+        for worker_id in range(workers)
+    ]
+
+    for process in processes:
+        process.start()
+
+    while len(broker.writers) < workers:
+        await asyncio.sleep(0.01)
+
+    started = time.perf_counter()
+    start.set()
+    await asyncio.gather(*[asyncio.to_thread(process.join) for process in processes])
+    elapsed = time.perf_counter() - started
+
+    await broker.stop()
+    os.remove(path)
+    return elapsed
+
+
+async def main(max_workers: int, messages: int) -> None:
+    print(f"{os.cpu_count()} cores, {SESSIONS} sessions per worker")
+
+    for workers in range(1, max_workers + 1):
+        elapsed = await run(workers, messages)
+        print(
+            f"{workers} workers: {messages} messages in {elapsed:.3f}s "
+            f"({messages / elapsed:.0f} messages/s, "
+            f"{messages * workers * SESSIONS / elapsed:.0f} deliveries/s)"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(
+        main(
+            int(sys.argv[1]) if len(sys.argv) > 1 else 4,
+            int(sys.argv[2]) if len(sys.argv) > 2 else 20_000,
+        )
+    )
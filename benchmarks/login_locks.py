@@ -0,0 +1,56 @@
+"""Benchmark: N concurrent logins under the old global lock vs per user name locks.
+
+Each simulated login does a database round trip (an `asyncio.sleep`)
+and an argon2 verify in a worker thread, just like `routers.cho.login`.
+
+usage: python -m benchmarks.login_locks [logins]
+"""
+import asyncio
+import sys
+import time
+from contextlib import AbstractAsyncContextManager
+from typing import Callable
+
+from passlib.hash import argon2
+
+from objects.locks import KeyedLock
+
+PASS_MD5 = "5f4dcc3b5aa765d61d8327deb882cf99"
+PASS_ARGON2 = argon2.hash(PASS_MD5)
+
+
+async def simulated_login() -> None:
+    await asyncio.sleep(0.005)  # account lookup
+    await asyncio.to_thread(argon2.verify, PASS_MD5, PASS_ARGON2)
+
+
+async def run(
+    logins: int,
+    lock_for: Callable[[str], AbstractAsyncContextManager],
+) -> float:
+    async def login(user_name: str) -> None:
+        async with lock_for(user_name):
+            await simulated_login()
+
+    started = time.perf_counter()
+    await asyncio.gather(*[login(f"user{i}") for i in range(logins)])
+    return time.perf_counter() - started
+
+
+async def main(logins: int) -> None:
+    global_lock = asyncio.Lock()
+    keyed_lock = KeyedLock()
+
+    for name, lock_for in (
+        ("global lock", lambda _: global_lock),
+        ("keyed lock", keyed_lock),
+    ):
+        elapsed = await run(logins, lock_for)
+        print(
+            f"{name:<12} {logins} logins in {elapsed:.3f}s "
+            f"({logins / elapsed:.1f} logins/s)"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 16))
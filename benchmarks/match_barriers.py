@@ -0,0 +1,149 @@
+"""Benchmark: load/skip/complete barriers across many full matches.
+
+Every match has 16 players, which start a round and each send
+MATCH_LOAD_COMPLETE, MATCH_SKIP_REQUEST and MATCH_COMPLETE through the real
+handlers. "rescan" shows what checking all 16 slots on every event would
+cost instead of the `Match.arrive` bitmasks.
+
+usage: python -m benchmarks.match_barriers [matches] [rounds]
+"""
+import asyncio
+import sys
+import time
+
+import common
+from benchmarks.session_snapshot import make_channels, make_sessions
+from enums.multiplayer import SlotStatus
+from objects.matches import BARRIERS, SLOT_COUNT, Match, MatchMapInfo
+from objects.session import Session
+from packets import ClientPackets
+from routers.cho import packet_handlers
+
+EVENTS = (
+    ClientPackets.MATCH_LOAD_COMPLETE,
+    ClientPackets.MATCH_SKIP_REQUEST,
+    ClientPackets.MATCH_COMPLETE,
+)
+
+
+def setup_matches(count: int) -> list[Match]:
+    channels = make_channels()
+    sessions = make_sessions(count * SLOT_COUNT, channels)
+    matches = []
+
+    for i in range(count):
+        players = sessions[i * SLOT_COUNT : (i + 1) * SLOT_COUNT]
+        match = Match(
+            id=common.matches.get_free_id(),
+            host_id=players[0].account.user_id,
+            in_progress=False,
+            free_mod=False,
+            game_mode=0,
+            mods=0,
+            name=f"benchmark {i}",
+            current_map=MatchMapInfo(name="map", id=1, md5="md5"),
+        )
+        match.init_channel()
+        common.matches.add(match)
+        common.channels.add(match.channel)
+
+        for session in players:
+            session.join_match(match)
+            common.sessions.append(session)
+
+        matches.append(match)
+
+    return matches
+
+
+def players(match: Match) -> list[Session]:
+    return [s for s in match.channel.sessions if s.account.user_id in match.user_slots]
+
+
+async def play(matches: list[Match], rounds: int) -> float:
+    rosters = [(match, players(match)) for match in matches]
+
+    started = time.perf_counter()
+
+    for _ in range(rounds):
+        for match, sessions in rosters:
+            await packet_handlers[ClientPackets.MATCH_START](sessions[0])
+
+            for packet_id in EVENTS:
+                for session in sessions:
+                    await packet_handlers[packet_id](session)
+
+            for session in sessions:
+                session.osu_client.clear_pending_packets()
+
+    return time.perf_counter() - started
+
+
+def rescan(match: Match, arrived: list[bool]) -> bool:
+    for slot_id in range(SLOT_COUNT):
+        if match.slot_statuses[slot_id] == SlotStatus.PLAYING and not arrived[slot_id]:
+            return False
+
+    return True
+
+
+def rescan_barriers(matches: list[Match], rounds: int) -> float:
+    for match in matches:
+        for slot_id in match.user_slots.values():
+            match.slot_statuses[slot_id] = SlotStatus.PLAYING
+
+    started = time.perf_counter()
+
+    for _ in range(rounds):
+        for match in matches:
+            for _ in EVENTS:
+                arrived = [False] * SLOT_COUNT
+
+                for slot_id in match.user_slots.values():
+                    arrived[slot_id] = True
+                    rescan(match, arrived)
+
+    return time.perf_counter() - started
+
+
+def bitmask_barriers(matches: list[Match], rounds: int) -> float:
+    started = time.perf_counter()
+
+    for _ in range(rounds):
+        for match in matches:
+            match.start()
+
+            for barrier in BARRIERS:
+                for slot_id in match.user_slots.values():
+                    match.arrive(barrier, slot_id)
+
+            match.finish()
+
+    return time.perf_counter() - started
+
+
+def main(count: int, rounds: int) -> None:
+    matches = setup_matches(count)
+    events = count * rounds * len(EVENTS) * SLOT_COUNT
+
+    elapsed = asyncio.run(play(matches, rounds))
+    print(
+        f"handlers  {count} matches, {events} events in {elapsed:.3f}s, "
+        f"{events / elapsed:.0f} events/s"
+    )
+
+    completed = all(not match.in_progress for match in matches)
+    print(f"          every round completed: {completed}")
+
+    elapsed = rescan_barriers(matches, rounds)
+    print(f"rescan    {elapsed / events * 1e9:.0f}ns per event, barrier check only")
+
+    elapsed = bitmask_barriers(matches, rounds)
+    print(f"bitmask   {elapsed / events * 1e9:.0f}ns per event, barrier check only")
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 64,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 20,
+    )
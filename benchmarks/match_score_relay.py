@@ -0,0 +1,120 @@
+"""Benchmark: MATCH_SCORE_UPDATE throughput in a full 16 player match.
+
+Every player polls with `FRAMES_PER_POLL` score frames, which go through
+`packets.read_packets` and the real handler, and are relayed to the other
+15 players. "decode" shows what decoding each frame into Python values
+and encoding it again would cost on top of reading it.
+
+usage: python -m benchmarks.match_score_relay [polls per player]
+"""
+import asyncio
+import struct
+import sys
+import time
+
+import common
+import packets
+from benchmarks.session_snapshot import make_channels, make_sessions
+from objects.matches import SLOT_COUNT, Match, MatchMapInfo
+from routers.cho import packet_handlers
+
+FRAMES_PER_POLL = 10
+
+# time, slot id, 300s, 100s, 50s, gekis, katus, misses, score, max combo,
+# combo, perfect, hp, tag, score v2
+SCORE_FRAME = struct.Struct("<iBHHHHHHiHHBBBB")
+
+
+def score_frame(time: int) -> bytes:
+    return SCORE_FRAME.pack(
+        time, 0, 300, 20, 1, 50, 10, 2, 1_000_000, 500, 321, 0, 200, 0, 0
+    )
+
+
+def decode_and_encode(frame: bytes, slot_id: int) -> bytes:
+    values = list(SCORE_FRAME.unpack(frame))
+    values[1] = slot_id
+    data = SCORE_FRAME.pack(*values)
+    return packets.write_packet(packets.ServerPackets.MATCH_SCORE_UPDATE, data)
+
+
+def setup_match() -> Match:
+    channels = make_channels()
+    sessions = make_sessions(SLOT_COUNT, channels)
+
+    match = Match(
+        id=1,
+        host_id=sessions[0].account.user_id,
+        in_progress=True,
+        free_mod=False,
+        game_mode=0,
+        mods=0,
+        name="benchmark",
+        current_map=MatchMapInfo(name="map", id=1, md5="md5"),
+    )
+    match.init_channel()
+    common.matches.add(match)
+    common.channels.add(match.channel)
+
+    for session in sessions:
+        session.join_match(match)
+        session.osu_client.pending_packets.clear()
+        common.sessions.append(session)
+
+    return match
+
+
+async def relay(match: Match, polls: int) -> float:
+    sessions = list(match.channel.sessions)
+    bodies = [
+        b"".join(
+            packets.PACKET_HEADER.pack(
+                packets.ClientPackets.MATCH_SCORE_UPDATE, SCORE_FRAME.size
+            )
+            + score_frame(poll * FRAMES_PER_POLL + i)
+            for i in range(FRAMES_PER_POLL)
+        )
+        for poll in range(4)
+    ]
+
+    started = time.perf_counter()
+
+    for poll in range(polls):
+        body = bodies[poll % len(bodies)]
+
+        for session in sessions:
+            for packet in packets.read_packets(body):
+                await packet_handlers[packet.id](session, packet.data)
+
+            session.osu_client.clear_pending_packets()
+
+    return time.perf_counter() - started
+
+
+def decode(polls: int) -> float:
+    frame = score_frame(0)
+
+    started = time.perf_counter()
+    for _ in range(polls * SLOT_COUNT * FRAMES_PER_POLL):
+        decode_and_encode(frame, 3)
+
+    return time.perf_counter() - started
+
+
+def main(polls: int) -> None:
+    match = setup_match()
+    frames = polls * SLOT_COUNT * FRAMES_PER_POLL
+
+    elapsed = asyncio.run(relay(match, polls))
+    print(
+        f"relay   {frames} frames in {elapsed:.3f}s, "
+        f"{frames / elapsed:.0f} frames/s in, "
+        f"{frames * (SLOT_COUNT - 1) / elapsed:.0f} frames/s out"
+    )
+
+    elapsed = decode(polls)
+    print(f"decode  {elapsed / frames * 1e6:.2f}us per frame on top")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
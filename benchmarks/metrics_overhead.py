@@ -0,0 +1,55 @@
+"""Benchmark: cost of the packet metrics on the request path.
+
+Shows what each metric update costs per call, and what a `/api/v1/metrics`
+scrape costs with every packet id seen.
+
+usage: python -m benchmarks.metrics_overhead [calls]
+"""
+import sys
+import time
+import timeit
+
+import metrics
+from packets import ClientPackets, ServerPackets
+from routers.api import export_monitor, export_objects, export_packets
+
+
+def per_call(statement, calls: int) -> float:
+    return timeit.timeit(statement, number=calls) / calls * 1e9
+
+
+def main(calls: int) -> None:
+    histogram = metrics.Histogram()
+    handled = metrics.PacketMetrics()
+    encoded = metrics.PacketMetrics()
+    ping, presence = ClientPackets.PING, ServerPackets.USER_PRESENCE
+
+    for name, statement in (
+        ("perf_counter", time.perf_counter),
+        ("histogram observe", lambda: histogram.observe(0.0003)),
+        ("handler observe", lambda: handled.observe(ping, 0.0003)),
+        ("encode count", lambda: encoded.count(presence, 33)),
+    ):
+        print(f"{name:<18} {per_call(statement, calls):.0f}ns per call")
+
+    for packet_id in ClientPackets:
+        metrics.HANDLED.observe(packet_id, 0.001)
+        metrics.DECODED.count(packet_id)
+
+    for packet_id in ServerPackets:
+        metrics.ENCODED.count(packet_id, 100)
+
+    def scrape() -> str:
+        page = metrics.Exposition()
+        export_packets(page)
+        export_objects(page)
+        export_monitor(page)
+        return page.text()
+
+    scrapes = max(1, calls // 10_000)
+    elapsed = timeit.timeit(scrape, number=scrapes) / scrapes
+    print(f"scrape             {elapsed * 1e3:.2f}ms, {len(scrape())} bytes")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
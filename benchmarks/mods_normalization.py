@@ -0,0 +1,73 @@
+"""Benchmark: per call cost of mods/mode normalization and the client mode lookup.
+
+The "enum" versions are the previous implementations, which built
+`Mods`/`GameMode` members on every call.
+
+usage: python -m benchmarks.mods_normalization [calls]
+"""
+import sys
+import timeit
+
+import utils
+from enums.game_mode import GameMode
+from enums.mods import Mods
+
+# (mods, client game mode) as sent by CHANGE_ACTION
+INPUTS = [
+    (0, 0),
+    (Mods.HIDDEN | Mods.DOUBLETIME, 0),
+    (Mods.RELAX | Mods.HIDDEN | Mods.HARDROCK, 0),
+    (Mods.AUTOPILOT, 0),
+    (Mods.RELAX, 3),
+    (Mods.AUTOPILOT | Mods.FLASHLIGHT, 1),
+    (Mods.KEY7 | Mods.MIRROR, 3),
+]
+INPUTS = [(int(mods), mode) for mods, mode in INPUTS]
+
+
+def enum_ensure_mods_and_gamemode(mods: int, game_mode: int) -> tuple[Mods, GameMode]:
+    if mods & Mods.RELAX:
+        if game_mode == GameMode.vn_mania:
+            mods &= ~Mods.RELAX
+        else:
+            game_mode += 4
+    elif mods & Mods.AUTOPILOT:
+        if game_mode in (GameMode.vn_taiko, GameMode.vn_catch, GameMode.vn_mania):
+            mods &= ~Mods.AUTOPILOT
+        else:
+            game_mode += 8
+
+    return Mods(mods), GameMode(game_mode)
+
+
+def enum_as_osu_client(mode: GameMode) -> GameMode:
+    if mode in (GameMode.rx_std, GameMode.rx_taiko, GameMode.rx_catch):
+        mode -= 4
+    elif mode == GameMode.ap_std:
+        mode -= 8
+
+    return GameMode(mode)
+
+
+def per_call(function, inputs: list, calls: int) -> float:
+    rounds = max(1, calls // len(inputs))
+    elapsed = timeit.timeit(
+        lambda: [function(*arguments) for arguments in inputs], number=rounds
+    )
+    return elapsed / (rounds * len(inputs)) * 1e9
+
+
+def main(calls: int) -> None:
+    modes = [(mode,) for mode in GameMode]
+
+    for name, function, inputs in (
+        ("normalize (enum)", enum_ensure_mods_and_gamemode, INPUTS),
+        ("normalize (table)", utils.normalize_mods_and_mode, INPUTS),
+        ("client mode (enum)", enum_as_osu_client, modes),
+        ("client mode (table)", utils.client_mode, modes),
+    ):
+        print(f"{name:<20} {per_call(function, inputs, calls):.0f}ns per call")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000)
@@ -0,0 +1,60 @@
+"""Benchmark: memory per online session.
+
+Builds N sessions (in #osu and #lobby, with their presence, like a login
+does) under tracemalloc, and shows the size of each object a session is
+made of, including its `__dict__` when it has one.
+
+usage: python -m benchmarks.session_memory [sessions]
+"""
+import sys
+import tracemalloc
+
+from benchmarks.session_snapshot import make_channels, make_sessions
+from objects.matches import Match, MatchMapInfo
+
+
+def object_size(obj: object) -> int:
+    size = sys.getsizeof(obj)
+
+    if hasattr(obj, "__dict__"):
+        size += sys.getsizeof(obj.__dict__)
+
+    return size
+
+
+def main(count: int) -> None:
+    tracemalloc.start()
+    channels = make_channels()
+    sessions = make_sessions(count, channels)
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{count} sessions, {used / count:.0f} bytes per session")
+
+    session = sessions[0]
+    match = Match(
+        id=0,
+        host_id=session.account.user_id,
+        in_progress=False,
+        free_mod=False,
+        game_mode=session.osu_client.status.mode,
+        mods=session.osu_client.status.mods,
+        name="match",
+        current_map=MatchMapInfo(name="", id=0, md5=""),
+    )
+
+    for obj in (
+        session,
+        session.account,
+        session.osu_client,
+        session.osu_client.status,
+        session.osu_client.details,
+        session.osu_client.details.adapters,
+        channels[0],
+        match,
+    ):
+        print(f"{type(obj).__name__:<14} {object_size(obj)} bytes")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000)
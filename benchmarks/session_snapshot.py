@@ -0,0 +1,123 @@
+"""Benchmark: saving and restoring N sessions through a `StateSnapshot`.
+
+Compared against the argon2 verifies alone that N logins would cost
+after a cold restart (extrapolated from a few, they dominate a login).
+
+usage: python -m benchmarks.session_snapshot [sessions]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from passlib.hash import argon2
+
+import packets
+from enums.privileges import ServerPrivileges
+from objects.channels import Channel
+from objects.collections import Channels, Sessions
+from objects.login import ClientDetails
+from objects.session import Account, OsuClient, Session
+from objects.snapshot import (
+    SNAPSHOT_VERSION,
+    StateSnapshot,
+    read_snapshot,
+    write_snapshot,
+)
+
+PASS_MD5 = "5f4dcc3b5aa765d61d8327deb882cf99"
+
+
+def make_channels() -> Channels:
+    return Channels.from_channels(
+        [
+            Channel("#osu", "main osu! channel", auto_join=True),
+            Channel("#lobby", "main osu! lobby channel", auto_join=False),
+        ]
+    )
+
+
+def make_sessions(count: int, channels: Channels) -> Sessions:
+    sessions = Sessions()
+
+    for user_id in range(4, count + 4):
+        session = Session(
+            account=Account(
+                user_id=user_id,
+                user_name=f"user{user_id}",
+                friends={user_id + 1, user_id + 2},
+                country_code="us",
+            ),
+            osu_client=OsuClient(
+                details=ClientDetails(
+                    osu_version=20221230.0,
+                    osu_path_md5="a" * 32,
+                    adapters_md5="b" * 32,
+                    uninstall_md5="c" * 32,
+                    disk_signature_md5="d" * 32,
+                    adapters=(),  # dropped once recorded
+                ),
+            ),
+            cho_token=f"0:token-{user_id}",
+            utc_offset=0,
+            privileges=ServerPrivileges.Normal,
+            last_pinged=time.time(),
+        )
+
+        for channel in channels:
+            session.join_channel(channel)
+
+        session.osu_client.pending_packets.clear()
+        sessions.append(session)
+        sessions.update_presence(user_id, packets.pack_osu_session(session))
+
+    return sessions
+
+
+def main(count: int) -> None:
+    channels = make_channels()
+    sessions = make_sessions(count, channels)
+    path = os.path.join(tempfile.gettempdir(), f"bancho-snapshot-{os.getpid()}.bin")
+
+    started = time.perf_counter()
+    size = write_snapshot(
+        path,
+        StateSnapshot(
+            version=SNAPSHOT_VERSION,
+            worker_id=0,
+            created=time.time(),
+            sessions=list(sessions),
+            presence=sessions.presence.entries,
+            channels=list(channels),
+            matches=[],
+            lobby=[],
+        ),
+    )
+    save_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    snapshot = read_snapshot(path, worker_id=0, max_age=60.0)
+    assert snapshot is not None
+
+    restored_sessions = Sessions()
+    restored_sessions.restore(snapshot.sessions, snapshot.presence)
+    restored_channels = make_channels()
+    restored_channels.restore(snapshot.channels)
+    restored_sessions.collect_all_sessions_for(restored_sessions[0])
+    restore_time = time.perf_counter() - started
+
+    samples = 5
+    pass_argon2 = argon2.hash(PASS_MD5)
+    started = time.perf_counter()
+    for _ in range(samples):
+        argon2.verify(PASS_MD5, pass_argon2)
+    argon2_time = (time.perf_counter() - started) / samples * count
+
+    print(f"{count} sessions, snapshot is {size / 1024:.0f} KiB")
+    print(f"save     {save_time * 1000:.1f}ms")
+    print(f"restore  {restore_time * 1000:.1f}ms")
+    print(f"relogin  {argon2_time * 1000:.0f}ms of argon2 alone (estimated)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000)
@@ -0,0 +1,234 @@
+"""Benchmark: SPECTATE_FRAMES fanout from one host to many spectators.
+
+Every round the host sends a frame bundle, which goes through
+`packets.read_packets` and the real handler, and then spectators poll.
+In the "slow" runs a tenth of the spectators never poll. "copy" appends
+each bundle to every spectator's `pending_packets` instead of sharing it
+through `common.frame_relay`, which lets slow spectators grow without bound.
+
+`check` runs `FrameRelay`'s cursor and eviction logic through a few
+scenarios first, and fails with an AssertionError if it's wrong.
+
+usage: python -m benchmarks.spectator_relay [spectators] [rounds]
+"""
+import asyncio
+import os
+import sys
+import time
+
+import common
+import packets
+from benchmarks.session_snapshot import make_channels, make_sessions
+from objects.session import Session
+from objects.spectators import FrameRelay
+from routers.cho import packet_handlers, read_spectate_frames
+
+# a replay frame bundle, about what a host sends every poll
+FRAMES_SIZE = 2048
+
+
+def setup_spectators(count: int) -> Session:
+    channels = make_channels()
+    sessions = make_sessions(count + 1, channels)
+
+    for session in sessions:
+        common.sessions.append(session)
+
+    host, spectators = sessions[0], sessions[1:]
+
+    for session in spectators:
+        asyncio.run(
+            packet_handlers[packets.ClientPackets.START_SPECTATING](
+                session, host.account.user_id
+            )
+        )
+
+    for session in sessions:
+        session.osu_client.clear_pending_packets()
+
+    return host
+
+
+def frames_body() -> bytes:
+    frames = os.urandom(FRAMES_SIZE)
+    return (
+        packets.PACKET_HEADER.pack(packets.ClientPackets.SPECTATE_FRAMES, len(frames))
+        + frames
+    )
+
+
+def pollers(host: Session, slow: bool) -> list[Session]:
+    spectators = list(host.spectators.values())
+    return spectators[len(spectators) // 10 :] if slow else spectators
+
+
+async def relay(host: Session, rounds: int, slow: bool) -> tuple[float, int]:
+    body = frames_body()
+    sessions = pollers(host, slow)
+    peak = 0
+
+    started = time.perf_counter()
+
+    for _ in range(rounds):
+        for packet in packets.read_packets(body):
+            await packet_handlers[packet.id](host, packet.data)
+
+        peak = max(peak, common.frame_relay.size)
+
+        for session in sessions:
+            read_spectate_frames(session)
+
+    elapsed = time.perf_counter() - started
+
+    # catch everyone up for the next run
+    for session in host.spectators.values():
+        read_spectate_frames(session)
+
+    return elapsed, peak
+
+
+def copy(host: Session, rounds: int, slow: bool) -> tuple[float, int]:
+    body = frames_body()
+    spectators = list(host.spectators.values())
+    sessions = pollers(host, slow)
+    peak = 0
+
+    started = time.perf_counter()
+
+    for _ in range(rounds):
+        for packet in packets.read_packets(body):
+            data = packets.spectate_frames(packet.data)
+
+            for session in spectators:
+                session.osu_client.pending_packets += data
+
+        peak = max(peak, sum(len(s.osu_client.pending_packets) for s in spectators))
+
+        for session in sessions:
+            session.osu_client.clear_pending_packets()
+
+    elapsed = time.perf_counter() - started
+
+    for session in spectators:
+        session.osu_client.clear_pending_packets()
+
+    return elapsed, peak
+
+
+def assert_sizes(relay: FrameRelay) -> None:
+    for buffer in relay.buffers.values():
+        assert buffer.size == sum(len(bundle) for bundle in buffer.bundles)
+        assert sum(buffer.readers.values()) == len(buffer.cursors)
+
+    assert relay.size == sum(buffer.size for buffer in relay.buffers.values())
+
+
+def check() -> None:
+    relay = FrameRelay(max_size=64, max_host_size=32)
+
+    # nothing is kept for a host nobody spectates
+    relay.relay("host", b"a" * 8)
+    assert len(relay) == 0 and relay.size == 0
+
+    # a spectator only gets what was relayed after it started spectating
+    relay.add_spectator("host", "first")
+    relay.relay("host", b"b" * 8)
+    relay.add_spectator("host", "second")
+    relay.relay("host", b"c" * 8)
+    assert_sizes(relay)
+
+    assert relay.read("host", "first") == (b"b" * 8 + b"c" * 8, False)
+    assert relay.read("host", "first") == (b"", False)
+
+    # kept until every spectator read it
+    assert relay.size == 8
+    assert relay.read("host", "second") == (b"c" * 8, False)
+    assert relay.size == 0
+    assert_sizes(relay)
+
+    # a spectator that stops reading is resynced once it fell `max_host_size` behind
+    for bundle in (b"d" * 8, b"e" * 8, b"f" * 8, b"g" * 8):
+        relay.relay("host", bundle)
+        assert relay.read("host", "first") == (bundle, False)
+
+    assert relay.dropped == 0 and relay.size == 32
+
+    relay.relay("host", b"h" * 8)
+    assert relay.dropped == 1
+    assert relay.read("host", "first") == (b"h" * 8, False)
+
+    # it lost bundles, so it no longer holds anything back
+    assert relay.size == 0
+    assert_sizes(relay)
+
+    relay.relay("host", b"i" * 8)
+    assert relay.read("host", "second") == (b"i" * 8, True)
+    assert relay.read("host", "first") == (b"i" * 8, False)
+    assert relay.resyncs == 1
+
+    # the first to read after falling behind gets what's left, the rest
+    # aren't held back for the others, and only a first resync is reported
+    for _ in range(5):
+        relay.relay("host", b"j" * 8)
+    assert relay.dropped == 2
+    assert relay.read("host", "first") == (b"j" * 32, True)
+    assert relay.read("host", "second") == (b"", False)
+    assert relay.resyncs == 3 and relay.size == 0
+
+    relay.relay("host", b"k" * 8)
+    assert relay.read("host", "second") == (b"k" * 8, False)
+    assert relay.read("host", "first") == (b"k" * 8, False)
+    assert_sizes(relay)
+
+    # the newest bundle is kept, even past `max_host_size`
+    relay.relay("host", b"l" * 40)
+    assert relay.read("host", "second") == (b"l" * 40, False)
+
+    # every host together stays under `max_size`, the host relaying is trimmed
+    relay.add_spectator("other", "third")
+    relay.relay("other", b"m" * 16)
+    relay.relay("other", b"n" * 16)
+    assert relay.size == 56 and relay.dropped == 3
+    assert relay.read("other", "third") == (b"n" * 16, True)
+    assert_sizes(relay)
+
+    # a host's buffer goes with its last spectator
+    relay.remove_spectator("host", "first")
+    assert "host" in relay.buffers
+    relay.remove_spectator("host", "second")
+    relay.remove_spectator("other", "third")
+    assert len(relay) == 0 and relay.size == 0 and relay.spectators == 0
+
+    print("check   cursors and eviction ok")
+
+
+def main(count: int, rounds: int) -> None:
+    check()
+
+    host = setup_spectators(count)
+
+    for name, slow, run in (
+        ("shared", False, lambda slow: asyncio.run(relay(host, rounds, slow))),
+        ("copy", False, lambda slow: copy(host, rounds, slow)),
+        ("shared", True, lambda slow: asyncio.run(relay(host, rounds, slow))),
+        ("copy", True, lambda slow: copy(host, rounds, slow)),
+    ):
+        elapsed, peak = run(slow)
+        print(
+            f"{name:<7} {'slow' if slow else 'all poll':<9} {count} spectators: "
+            f"{elapsed / rounds * 1e6:.0f}us per round, "
+            f"{peak / 1024:.0f}KiB queued at most"
+        )
+
+    relay_ = common.frame_relay
+    print(
+        f"relay   {relay_.relayed} bundles relayed, {relay_.dropped} dropped, "
+        f"{relay_.resyncs} resyncs"
+    )
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 500,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 1000,
+    )
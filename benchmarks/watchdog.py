@@ -0,0 +1,67 @@
+"""Benchmark: the event loop lag monitor and slow operation watchdog.
+
+Shows what `Watchdog.begin`/`end` cost around every packet handler, then
+runs a handler that blocks the event loop with a synchronous sleep, which
+the watchdog should log with its stack, and the lag monitor should see.
+
+usage: python -m benchmarks.watchdog [calls] [block seconds]
+"""
+import asyncio
+import sys
+import time
+import timeit
+
+from objects.watchdog import LoopLagMonitor, Watchdog
+
+
+def blocking_database_call(seconds: float) -> None:
+    time.sleep(seconds)
+
+
+async def slow_handler(seconds: float) -> None:
+    blocking_database_call(seconds)
+
+
+async def run(watchdog: Watchdog, monitor: LoopLagMonitor, block: float) -> None:
+    watchdog.start()
+    monitor.start()
+
+    # let the monitor take a few samples of an idle loop first
+    await asyncio.sleep(monitor.interval * 5)
+
+    operation_id = watchdog.begin("packet", "SLOW_HANDLER", "benchmark")
+    try:
+        await slow_handler(block)
+    finally:
+        watchdog.end(operation_id)
+
+    await asyncio.sleep(monitor.interval * 2)
+
+    await monitor.stop()
+    watchdog.stop()
+
+
+def main(calls: int, block: float) -> None:
+    watchdog = Watchdog(threshold=0.25, interval=0.05)
+    monitor = LoopLagMonitor(interval=0.05, threshold=0.1)
+
+    def begin_end() -> None:
+        watchdog.end(watchdog.begin("packet", "PING", "benchmark"))
+
+    elapsed = timeit.timeit(begin_end, number=calls)
+    print(f"begin/end  {elapsed / calls * 1e9:.0f}ns per handler")
+
+    asyncio.run(run(watchdog, monitor, block))
+
+    print(f"slow       {watchdog.slow}")
+    print(
+        f"lag        max {monitor.max_lag * 1000:.0f}ms, "
+        f"{monitor.stalls} stalls past {monitor.threshold * 1000:.0f}ms"
+    )
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 200_000,
+        float(sys.argv[2]) if len(sys.argv) > 2 else 0.5,
+    )
@@ -1,4 +1,9 @@
-from . import database, locks
+from . import database, limits, locks, monitor, queues
+from .accounts import _accounts as accounts
+from .bus import _bus as bus
 from .channels import _channels as channels
+from .credentials import _credentials as credentials
+from .lobby import _lobby as lobby
 from .matches import _matches as matches
 from .sessions import _sessions as sessions
+from .spectators import _frame_relay as frame_relay
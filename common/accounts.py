@@ -0,0 +1,8 @@
+from objects import Accounts
+
+ACCOUNT_CACHE_SIZE = 10_000
+
+# seconds, how long a privilege change made outside this worker can go unseen
+ACCOUNT_CACHE_TTL = 60.0
+
+_accounts: Accounts = Accounts(max_size=ACCOUNT_CACHE_SIZE, ttl=ACCOUNT_CACHE_TTL)
@@ -0,0 +1,64 @@
+from typing import Iterable, Optional
+
+from objects import Session
+from objects.event_bus import EventBus, Topic, TopicKind
+
+from .accounts import _accounts
+from .channels import _channels
+from .lobby import _lobby
+from .matches import _matches
+from .sessions import _sessions
+
+
+def sessions_for(topic: Topic) -> Iterable[Session]:
+    if topic.kind in (TopicKind.GLOBAL, TopicKind.PRESENCE, TopicKind.LOGOUT):
+        return _sessions
+
+    if topic.kind == TopicKind.USER:
+        session = _sessions.get_from_user_id(int(topic.key))
+        return (session,) if session is not None else ()
+
+    if topic.kind == TopicKind.CHANNEL:
+        channel = _channels.get_from_name(topic.key)
+        return channel.sessions if channel is not None else ()
+
+    if topic.kind == TopicKind.LOBBY:
+        return _lobby
+
+    if topic.kind == TopicKind.MATCH:
+        match = _matches.get_from_id(int(topic.key))
+        if match is None:
+            return ()
+
+        # the players are all in the match's channel, no need to search every session
+        return [
+            session
+            for session in match.channel.sessions
+            if session.account.user_id in match.user_slots
+        ]
+
+    return ()
+
+
+def deliver(topic: Topic, data: bytes, excluded_token: Optional[str]) -> None:
+    """Hands a published packet to every session in this worker it's meant for."""
+    if topic.kind == TopicKind.PRESENCE:
+        _sessions.update_presence(int(topic.key), data)
+    elif topic.kind == TopicKind.LOGOUT:
+        _sessions.remove_presence(int(topic.key))
+        # its friends may change in whichever worker it logs in to next
+        _accounts.remove(int(topic.key))
+
+    for session in sessions_for(topic):
+        if session.is_bot or session.cho_token == excluded_token:
+            continue
+
+        session.osu_client.pending_packets += data
+
+
+def local_presence(user_id: int) -> Optional[bytes]:
+    return _sessions.presence.entries.get(user_id)
+
+
+# `main.run_worker` sets the worker id and backend when running several workers
+_bus: EventBus = EventBus(deliver=deliver, presence=local_presence)
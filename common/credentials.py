@@ -0,0 +1,3 @@
+from objects.credentials import CredentialCache
+
+_credentials: CredentialCache = CredentialCache(ttl=300.0, max_size=100_000)
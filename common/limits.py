@@ -0,0 +1,15 @@
+from objects.rate_limits import RateLimiter
+
+# checked before a login is parsed or touches the database
+LOGIN_IP = RateLimiter(rate=1.0, burst=20, max_keys=100_000)
+
+# by (ip, user name), so nobody can lock someone else out of their account,
+# only charged for wrong passwords, see `routers.cho.login`
+LOGIN_USER_NAME = RateLimiter(rate=0.1, burst=5, max_keys=100_000)
+
+# per account, every friend is kept in memory while online
+MAX_FRIENDS = 500
+
+# addresses whose X-Real-IP header is believed, workers only listen on
+# 127.0.0.1 so by default that's a proxy on the same machine
+TRUSTED_PROXIES: set[str] = {"127.0.0.1", "::1"}
@@ -0,0 +1,3 @@
+from objects import Lobby
+
+_lobby: Lobby = Lobby()
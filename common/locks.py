@@ -1,3 +1,12 @@
-import asyncio
+from objects.admission import AdmissionController
+from objects.locks import KeyedLock
 
-LOGIN = asyncio.Lock()
\ No newline at end of file
+# keyed by normalized user name, see `utils.normalize_user_name`
+LOGIN = KeyedLock()
+
+LOGIN_ADMISSION = AdmissionController(
+    max_concurrent=32,
+    max_queued=256,
+    max_wait=10.0,
+)
+LOGIN_RETRY_DELAY = 5000  # ms, sent to rejected logins with `packets.system_restart`
@@ -1,3 +1,6 @@
 from objects import Matches
 
-_matches: Matches = Matches()
\ No newline at end of file
+# up to `objects.matches.MAX_MATCH_ID`
+MATCH_CAPACITY = 1024
+
+_matches: Matches = Matches(capacity=MATCH_CAPACITY)
@@ -0,0 +1,8 @@
+from objects.watchdog import LoopLagMonitor, Watchdog
+
+# seconds, past this a packet handler or login is logged with the event loop's
+# stack, see `main.py --slow-threshold`
+SLOW_OPERATION_THRESHOLD = 0.25
+
+LOOP_LAG = LoopLagMonitor(interval=0.1, threshold=0.1)
+WATCHDOG = Watchdog(threshold=SLOW_OPERATION_THRESHOLD, interval=0.1)
@@ -0,0 +1,26 @@
+from database.models import ClientDetail
+from database.writers import (
+    FriendshipChange,
+    write_client_details,
+    write_friendship_changes,
+)
+from objects.queues import WriteBehindQueue
+
+from . import database
+
+FRIENDSHIPS: WriteBehindQueue[FriendshipChange] = WriteBehindQueue(
+    name="friendship",
+    flush=lambda changes: write_friendship_changes(database.engine, changes),
+    max_batch_size=500,
+    flush_interval=1.0,
+)
+
+# written on every login, for multi account detection
+CLIENT_DETAILS: WriteBehindQueue[ClientDetail] = WriteBehindQueue(
+    name="client detail",
+    flush=lambda client_details: write_client_details(database.engine, client_details),
+    max_batch_size=1000,
+    flush_interval=5.0,
+)
+
+ALL_QUEUES: list[WriteBehindQueue] = [FRIENDSHIPS, CLIENT_DETAILS]
@@ -0,0 +1,9 @@
+from objects.spectators import FrameRelay
+
+# how far behind its host a spectator can fall, before it's resynced
+MAX_SPECTATOR_BACKLOG = 1024 * 1024
+
+_frame_relay: FrameRelay = FrameRelay(
+    max_size=64 * 1024 * 1024,
+    max_host_size=MAX_SPECTATOR_BACKLOG,
+)
@@ -1,4 +1,8 @@
-from pytz import country_timezones
+import bisect
+from datetime import datetime
+from typing import Optional
+
+from pytz import BaseTzInfo, all_timezones, country_timezones, timezone, utc
 
 # fmt: off
 country_codes_to_osu_code = {
@@ -43,3 +47,64 @@ for country_code in country_timezones:
     time_zones = country_timezones[country_code]
     for time_zone in time_zones:
         time_zone_to_country_code[time_zone] = country_code
+
+# utc offset (in hours) -> country code, see `get_country_code_from_utc_offset`
+utc_offset_to_country_code: dict[float, str] = {}
+utc_offset_table_expires = datetime.min  # naive utc
+
+
+def next_utc_transition(time_zone: BaseTzInfo, now: datetime) -> datetime:
+    # only `DstTzInfo` zones have transitions, `StaticTzInfo` never changes
+    transitions = getattr(time_zone, "_utc_transition_times", None)
+    if not transitions:
+        return datetime.max
+
+    index = bisect.bisect_right(transitions, now)
+    if index == len(transitions):
+        return datetime.max
+
+    return transitions[index]
+
+
+def build_utc_offset_table(now: Optional[datetime] = None) -> None:
+    global utc_offset_table_expires
+
+    if now is None:
+        now = datetime.utcnow()
+
+    table: dict[float, str] = {}
+    expires = datetime.max
+
+    for time_zone_name in all_timezones:
+        time_zone = timezone(time_zone_name)
+        expires = min(expires, next_utc_transition(time_zone, now))
+
+        offset = utc.localize(now).astimezone(time_zone).utcoffset()
+        assert offset is not None
+
+        offset_hours = offset.total_seconds() / 3600
+        if offset_hours in table:
+            # keep the first matching time zone, same as a linear search would
+            continue
+
+        if time_zone_name not in time_zone_to_country_code:
+            continue
+
+        country_code = time_zone_to_country_code[time_zone_name].lower()
+
+        if country_code not in country_codes_to_osu_code:
+            continue
+
+        table[offset_hours] = country_code
+
+    utc_offset_to_country_code.clear()
+    utc_offset_to_country_code.update(table)
+    utc_offset_table_expires = expires
+
+
+def get_country_code_from_utc_offset(utc_offset: int) -> str:
+    # the table is only valid until the next dst transition of any time zone
+    if datetime.utcnow() >= utc_offset_table_expires:
+        build_utc_offset_table()
+
+    return utc_offset_to_country_code.get(utc_offset, "XX")
@@ -1 +1 @@
-from . import models
+from . import migrations, models, writers
@@ -0,0 +1,152 @@
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from sqlalchemy.engine import Connection
+from sqlalchemy.future import Engine
+
+from database.models.accounts import BOT_USER_ID
+
+# `SQLModel.metadata.create_all` creates missing tables,
+# everything else about the schema is a versioned migration here.
+# the applied version is stored in sqlite's `user_version` pragma.
+
+
+class MigrationError(Exception):
+    """A migration can't be applied to the data as it is, nothing was changed."""
+
+
+@dataclass
+class Migration:
+    version: int
+    description: str
+    statements: list[str]
+
+    # runs before `statements`, in the same transaction
+    function: Optional[Callable[[Connection], None]] = None
+
+
+def check_unique_user_names(connection: Connection) -> None:
+    duplicates = connection.exec_driver_sql(
+        "SELECT group_concat(id || ' ' || user_name, ', ') FROM account "
+        "GROUP BY lower(user_name) HAVING count(*) > 1"
+    ).all()
+
+    if duplicates:
+        raise MigrationError(
+            "Accounts whose user names only differ in case have to be renamed "
+            "before they can be made unique: "
+            + "; ".join(accounts for (accounts,) in duplicates)
+        )
+
+
+def autoincrement_account_ids(connection: Connection) -> None:
+    """Rebuilds an account table from before ids were AUTOINCREMENT.
+
+    Without it sqlite hands out max(id) + 1, which reuses the ids of the
+    newest accounts if they're deleted, and the bot's id in an empty table."""
+    sql = connection.exec_driver_sql(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'account'"
+    ).scalar_one()
+
+    if "AUTOINCREMENT" in sql.upper():
+        return None
+
+    for statement in (
+        # left over if this was interrupted before, sqlite runs ddl outside
+        # of a transaction until the first insert
+        "DROP TABLE IF EXISTS account_autoincrement",
+        "CREATE TABLE account_autoincrement ("
+        "id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT, "
+        "user_name VARCHAR NOT NULL, "
+        "pass_argon2 VARCHAR NOT NULL, "
+        "friends VARCHAR NOT NULL, "
+        "country_code VARCHAR NOT NULL, "
+        "privileges INTEGER NOT NULL)",
+        "INSERT INTO account_autoincrement "
+        "(id, user_name, pass_argon2, friends, country_code, privileges) "
+        "SELECT id, user_name, pass_argon2, friends, country_code, privileges "
+        "FROM account",
+        "DROP TABLE account",
+        "ALTER TABLE account_autoincrement RENAME TO account",
+        "CREATE UNIQUE INDEX ix_account_user_name ON account (lower(user_name))",
+        # the copy above only made a sqlite_sequence row if there were accounts
+        "DELETE FROM sqlite_sequence WHERE name = 'account'",
+        "INSERT INTO sqlite_sequence (name, seq) "
+        f"SELECT 'account', max(coalesce(max(id), 0), {BOT_USER_ID}) FROM account",
+    ):
+        connection.exec_driver_sql(statement)
+
+
+MIGRATIONS: list[Migration] = [
+    Migration(
+        version=1,
+        description="unique case insensitive index on account user names",
+        statements=[
+            "CREATE UNIQUE INDEX IF NOT EXISTS ix_account_user_name "
+            "ON account (lower(user_name))",
+        ],
+        function=check_unique_user_names,
+    ),
+    Migration(
+        version=2,
+        description="index client details by user and hardware hashes",
+        statements=[
+            "CREATE INDEX IF NOT EXISTS ix_clientdetail_user_id "
+            "ON clientdetail (user_id)",
+            "CREATE INDEX IF NOT EXISTS ix_clientdetail_osu_path_md5 "
+            "ON clientdetail (osu_path_md5)",
+            "CREATE INDEX IF NOT EXISTS ix_clientdetail_adapters_md5 "
+            "ON clientdetail (adapters_md5)",
+            "CREATE INDEX IF NOT EXISTS ix_clientdetail_uninstall_md5 "
+            "ON clientdetail (uninstall_md5)",
+            "CREATE INDEX IF NOT EXISTS ix_clientdetail_disk_signature_md5 "
+            "ON clientdetail (disk_signature_md5)",
+        ],
+    ),
+    Migration(
+        version=3,
+        description="move account friends into the friendship table",
+        statements=[
+            "CREATE INDEX IF NOT EXISTS ix_friendship_friend_id "
+            "ON friendship (friend_id)",
+            "INSERT OR IGNORE INTO friendship (user_id, friend_id) "
+            "SELECT account.id, json_each.value "
+            "FROM account, json_each(account.friends)",
+        ],
+    ),
+    Migration(
+        version=4,
+        description="allocate account ids with AUTOINCREMENT in older databases",
+        statements=[],
+        function=autoincrement_account_ids,
+    ),
+]
+
+
+def get_schema_version(engine: Engine) -> int:
+    with engine.connect() as connection:
+        return connection.exec_driver_sql("PRAGMA user_version").scalar_one()
+
+
+def apply_migrations(engine: Engine) -> int:
+    """Applies every migration newer than the database's schema version,
+    each one in its own transaction. Returns the new schema version."""
+    version = get_schema_version(engine)
+
+    for migration in MIGRATIONS:
+        if migration.version <= version:
+            continue
+
+        with engine.begin() as connection:
+            if migration.function is not None:
+                migration.function(connection)
+
+            for statement in migration.statements:
+                connection.exec_driver_sql(statement)
+
+            connection.exec_driver_sql(f"PRAGMA user_version = {migration.version}")
+
+        print(f"Applied migration {migration.version}: {migration.description}")
+        version = migration.version
+
+    return version
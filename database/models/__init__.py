@@ -1,2 +1,3 @@
 from .accounts import *
 from .client_details import *
+from .friendships import *
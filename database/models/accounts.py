@@ -1,24 +1,42 @@
-import json
 from typing import Optional
 
+from sqlalchemy import DDL, event
 from sqlmodel import Field, SQLModel
 
 from database.types import JSON, PRIVILEGES
-from objects.session import Account as AccountSession
+from objects.session import AccountRecord
+
+BOT_USER_ID = 3
 
 
 class Account(SQLModel, table=True):
-    id: int = Field(default=3, primary_key=True)
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    id: Optional[int] = Field(default=None, primary_key=True)
     user_name: str
     pass_argon2: str
-    friends: JSON
+    friends: JSON  # unused, see `database.models.Friendship`
     country_code: str
     privileges: PRIVILEGES
 
-    def as_account_session(self) -> AccountSession:
-        return AccountSession(
-            user_id=self.id,
+    def as_account_record(self, friends: set[int]) -> AccountRecord:
+        assert self.id is not None
+
+        return AccountRecord(
+            id=self.id,
             user_name=self.user_name,
-            friends=json.loads(self.friends),
+            pass_argon2=self.pass_argon2,
+            friends=friends,
             country_code=self.country_code,
+            privileges=self.privileges,
         )
+
+
+# ids are handed out by the database, start them after the bot's id
+event.listen(
+    Account.__table__,  # type: ignore
+    "after_create",
+    DDL(
+        f"INSERT INTO sqlite_sequence (name, seq) VALUES ('account', {BOT_USER_ID})"
+    ).execute_if(dialect="sqlite"),
+)
@@ -0,0 +1,6 @@
+from sqlmodel import Field, SQLModel
+
+
+class Friendship(SQLModel, table=True):
+    user_id: int = Field(primary_key=True)
+    friend_id: int = Field(primary_key=True)
@@ -0,0 +1,57 @@
+from dataclasses import dataclass
+from itertools import groupby
+
+from sqlalchemy import and_, bindparam, delete, insert
+from sqlalchemy.future import Engine
+
+from database.models import ClientDetail, Friendship
+
+# flush functions for `common.queues`, these run in a worker thread
+
+
+@dataclass
+class FriendshipChange:
+    user_id: int
+    friend_id: int
+    added: bool
+
+
+def write_friendship_changes(engine: Engine, changes: list[FriendshipChange]) -> None:
+    insert_friendships = insert(Friendship).prefix_with("OR IGNORE")
+    delete_friendships = delete(Friendship).where(
+        and_(
+            Friendship.user_id == bindparam("removed_user_id"),
+            Friendship.friend_id == bindparam("removed_friend_id"),
+        )
+    )
+
+    with engine.begin() as connection:
+        # keep the order of changes, but batch runs of the same kind
+        for added, run in groupby(changes, key=lambda change: change.added):
+            if added:
+                connection.execute(
+                    insert_friendships,
+                    [
+                        {"user_id": change.user_id, "friend_id": change.friend_id}
+                        for change in run
+                    ],
+                )
+            else:
+                connection.execute(
+                    delete_friendships,
+                    [
+                        {
+                            "removed_user_id": change.user_id,
+                            "removed_friend_id": change.friend_id,
+                        }
+                        for change in run
+                    ],
+                )
+
+
+def write_client_details(engine: Engine, client_details: list[ClientDetail]) -> None:
+    with engine.begin() as connection:
+        connection.execute(
+            insert(ClientDetail),
+            [client_detail.dict(exclude={"id"}) for client_detail in client_details],
+        )
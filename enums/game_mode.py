@@ -12,13 +12,16 @@ class GameMode(enum.IntEnum):
     rx_taiko = 5
     rx_catch = 6
 
-    ap_std = 7
+    # the client adds 4 to its mode for relax and 8 for autopilot, 7 is unused
+    ap_std = 8
 
-    @property
-    def as_osu_client(self) -> "GameMode":
-        if self in (self.rx_std, self.rx_taiko, self.rx_catch):
-            self -= 4
-        elif self == self.ap_std:
-            self -= 8
 
-        return GameMode(self)
+# hot paths keep modes as plain ints and index these instead of building enums
+
+# the game mode the osu! client knows, indexed by ours (7 isn't a mode)
+MODE_TO_CLIENT_MODE = (0, 1, 2, 3, 0, 1, 2, 0, 0)
+
+# our game mode with relax or autopilot on, indexed by the client's,
+# None when the client's mode doesn't have that mod
+CLIENT_MODE_TO_RELAX_MODE = (4, 5, 6, None)
+CLIENT_MODE_TO_AUTOPILOT_MODE = (8, None, None, None)
@@ -25,3 +25,31 @@ class ClientPrivileges(enum.IntFlag):
     Owner = 1 << 3
     Developer = 1 << 4
     Tournament = 1 << 5
+
+
+def _server_to_client_privileges(server_privileges: int) -> int:
+    client_privileges = ClientPrivileges.Player.value
+
+    if server_privileges & ServerPrivileges.Normal:
+        client_privileges |= ClientPrivileges.Supporter
+
+    if server_privileges & (ServerPrivileges.Admin | ServerPrivileges.Mod):
+        client_privileges |= ClientPrivileges.Moderator
+
+    if server_privileges & ServerPrivileges.EventManager:
+        client_privileges |= ClientPrivileges.Tournament
+
+    if server_privileges & ServerPrivileges.Developer:
+        client_privileges |= ClientPrivileges.Developer
+
+    if server_privileges & ServerPrivileges.Owner:
+        client_privileges |= ClientPrivileges.Owner
+
+    return client_privileges
+
+
+# the client's privilege byte, indexed by every combination of server privileges
+SERVER_TO_CLIENT_PRIVILEGES = tuple(
+    _server_to_client_privileges(server_privileges)
+    for server_privileges in range(ServerPrivileges.Banned << 1)
+)
@@ -1,4 +1,12 @@
 """Bancho Service: Web server that handles c*.ppy.sh requests."""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import time
+from typing import Optional, Sequence
+
 import sqlmodel
 import uvicorn
 from fastapi import FastAPI
@@ -6,9 +14,23 @@ from sqlmodel import create_engine
 
 import commands
 import common
+import constants
+import database
+from objects.event_bus import EventBroker, UnixSocketBackend
+from objects.snapshot import (
+    SNAPSHOT_VERSION,
+    StateSnapshot,
+    read_snapshot,
+    write_snapshot,
+)
+from objects.worker_proxy import WorkerProxy
 
 # from objects import Bot
 
+# clients keep polling with their token while we restart,
+# past this they have given up and will log in again anyway
+SNAPSHOT_MAX_AGE = 120.0
+
 app = FastAPI(
     title="Bancho Service for coveri.xyz",
 )
@@ -27,23 +49,233 @@ def init_app(app: FastAPI) -> FastAPI:
         # bot.commands = commands.all_commands
         # common.sessions.append(bot)
 
-        common.database.engine = create_engine(url="sqlite:///database.db", echo=True)
+        init_database()
 
-        sqlmodel.SQLModel.metadata.create_all(
-            common.database.engine,
-        )
+        constants.time.build_utc_offset_table()
+
+        # before connecting, which sends the restored sessions to the broker
+        restore_snapshot()
+
+        await common.bus.start()
+
+        for queue in common.queues.ALL_QUEUES:
+            queue.start()
+
+        common.monitor.LOOP_LAG.start()
+        common.monitor.WATCHDOG.start()
+
+    @app.on_event("shutdown")
+    async def shut_down() -> None:
+        common.monitor.WATCHDOG.stop()
+        await common.monitor.LOOP_LAG.stop()
+
+        save_snapshot()
+
+        for queue in common.queues.ALL_QUEUES:
+            await queue.stop()
+
+        await common.bus.stop()
 
     return app
 
 
+def init_database() -> None:
+    common.database.engine = create_engine(url="sqlite:///database.db", echo=True)
+
+    sqlmodel.SQLModel.metadata.create_all(
+        common.database.engine,
+    )
+    database.migrations.apply_migrations(common.database.engine)
+
+
+def snapshot_path() -> str:
+    return f"snapshot-{common.bus.worker_id}.bin"
+
+
+def save_snapshot() -> None:
+    started = time.perf_counter()
+
+    snapshot = StateSnapshot(
+        version=SNAPSHOT_VERSION,
+        worker_id=common.bus.worker_id,
+        created=time.time(),
+        sessions=list(common.sessions),
+        presence=common.sessions.presence.entries,
+        channels=list(common.channels),
+        matches=list(common.matches),
+        lobby=list(common.lobby),
+    )
+    size = write_snapshot(snapshot_path(), snapshot)
+
+    print(
+        f"Saved {len(snapshot.sessions)} sessions to {snapshot_path()} "
+        f"({size} bytes, {time.perf_counter() - started:.3f}s)"
+    )
+
+
+def restore_snapshot() -> None:
+    started = time.perf_counter()
+
+    snapshot = read_snapshot(snapshot_path(), common.bus.worker_id, SNAPSHOT_MAX_AGE)
+    if snapshot is None:
+        return None
+
+    # the broker sends everyone else's, as they are now
+    user_ids = {session.account.user_id for session in snapshot.sessions}
+    common.sessions.restore(
+        snapshot.sessions,
+        {
+            user_id: presence
+            for user_id, presence in snapshot.presence.items()
+            if user_id in user_ids
+        },
+    )
+    common.channels.restore(snapshot.channels)
+    common.matches.restore(snapshot.matches)
+
+    for session in snapshot.lobby:
+        common.lobby.add(session)
+
+    # frames in flight are lost, spectators carry on from the next ones
+    for session in snapshot.sessions:
+        if session.spectating is not None:
+            common.frame_relay.add_spectator(
+                session.spectating.cho_token, session.cho_token
+            )
+
+    # the other workers logged these sessions out when we disconnected
+    for session in snapshot.sessions:
+        common.bus.register(
+            session.cho_token, session.account.user_id, session.account.user_name
+        )
+
+    print(
+        f"Restored {len(snapshot.sessions)} sessions from {snapshot_path()} "
+        f"({time.perf_counter() - started:.3f}s)"
+    )
+
+
 app = init_app(app)
 
 
-def main() -> int:
+def run_worker(
+    worker_id: int,
+    port: int,
+    event_bus_path: Optional[str] = None,
+    slow_threshold: float = common.monitor.SLOW_OPERATION_THRESHOLD,
+    trusted_proxies: Optional[Sequence[str]] = None,
+) -> None:
+    common.bus.worker_id = worker_id
+    common.monitor.WATCHDOG.threshold = slow_threshold
+
+    if trusted_proxies is not None:
+        common.limits.TRUSTED_PROXIES = set(trusted_proxies)
+
+    if event_bus_path is not None:
+        common.bus.backend = UnixSocketBackend(event_bus_path)
+
     uvicorn.run(
-        app="main:app",
+        app=app,
         host="127.0.0.1",
-        port=8003,
+        port=port,
+    )
+
+
+async def run_workers(
+    workers: int,
+    port: int,
+    slow_threshold: float,
+    trusted_proxies: Optional[Sequence[str]],
+) -> None:
+    """Not reachable from the command line yet, see `main`."""
+    # migrate once, before any worker starts
+    init_database()
+
+    event_bus_path = os.path.join(tempfile.gettempdir(), f"bancho-service-{port}.sock")
+    if os.path.exists(event_bus_path):
+        os.remove(event_bus_path)
+
+    broker = EventBroker(event_bus_path)
+    await broker.start()
+
+    # the proxy listens on port and forwards to worker n on port + 1 + n, by
+    # the cho token's "<worker id>:" prefix, workers only trust its X-Real-IP
+    ports = [port + 1 + worker_id for worker_id in range(workers)]
+    proxy = WorkerProxy(
+        "127.0.0.1",
+        ports,
+        trusted_proxies or common.limits.TRUSTED_PROXIES,
+    )
+
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(
+            target=run_worker,
+            args=(
+                worker_id,
+                ports[worker_id],
+                event_bus_path,
+                slow_threshold,
+            ),
+        )
+        for worker_id in range(workers)
+    ]
+
+    for process in processes:
+        process.start()
+
+    server = uvicorn.Server(uvicorn.Config(app=proxy, host="127.0.0.1", port=port))
+
+    try:
+        await asyncio.gather(
+            server.serve(),
+            *[asyncio.to_thread(process.join) for process in processes],
+        )
+    finally:
+        await broker.stop()
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8003)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="worker processes, only 1 is supported for now",
+    )
+    parser.add_argument(
+        "--slow-threshold",
+        type=float,
+        default=common.monitor.SLOW_OPERATION_THRESHOLD,
+        help="seconds, packet handlers and logins taking longer are logged",
+    )
+    parser.add_argument(
+        "--trusted-proxy",
+        action="append",
+        dest="trusted_proxies",
+        help="address whose X-Real-IP header is trusted, can be repeated "
+        "(default: 127.0.0.1 and ::1)",
+    )
+    args = parser.parse_args(argv)
+
+    if args.workers < 1:
+        parser.error("--workers has to be at least 1")
+
+    # matches, the lobby, spectating and stats requests only reach the
+    # sessions in their own worker, so players split across workers
+    # couldn't play together
+    if args.workers > 1:
+        parser.error(
+            "more than 1 worker isn't supported, multiplayer, the lobby, "
+            "spectating and stats requests only work within one worker"
+        )
+
+    run_worker(
+        worker_id=0,
+        port=args.port,
+        slow_threshold=args.slow_threshold,
+        trusted_proxies=args.trusted_proxies,
     )
     return 0
 
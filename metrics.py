@@ -0,0 +1,155 @@
+"""Counters and histograms, exported at /api/v1/metrics in the Prometheus text format.
+
+Everything is updated from the event loop, so nothing is locked, and
+histogram buckets are fixed up front so observing a value never allocates."""
+import bisect
+import math
+from typing import Iterable, Optional, Sequence
+
+# seconds, from a dictionary lookup to a stuck database call
+LATENCY_BUCKETS = (
+    0.00005,
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+)
+
+# every `packets.ClientPackets` and `packets.ServerPackets` id is below this
+PACKET_ID_LIMIT = 128
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "total")
+
+    def __init__(self, bounds: Sequence[float] = LATENCY_BUCKETS) -> None:
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)  # the last one is +Inf
+        self.total = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+
+
+class PacketMetrics:
+    """Counts, errors, bytes and latency by packet id, ids index straight into lists."""
+
+    __slots__ = ("counts", "errors", "sizes", "latencies")
+
+    def __init__(self) -> None:
+        self.counts = [0] * PACKET_ID_LIMIT
+        self.errors = [0] * PACKET_ID_LIMIT
+        self.sizes = [0] * PACKET_ID_LIMIT  # bytes
+
+        # only made for packets that are timed
+        self.latencies: list[Optional[Histogram]] = [None] * PACKET_ID_LIMIT
+
+    def count(self, packet_id: int, size: int = 0) -> None:
+        self.counts[packet_id] += 1
+        self.sizes[packet_id] += size
+
+    def observe(self, packet_id: int, seconds: float) -> None:
+        self.counts[packet_id] += 1
+
+        histogram = self.latencies[packet_id]
+        if histogram is None:
+            histogram = self.latencies[packet_id] = Histogram()
+
+        histogram.observe(seconds)
+
+
+HANDLED = PacketMetrics()  # client packets, by `routers.cho.bancho_handler`
+DECODED = PacketMetrics()  # client packets, by `packets.read_packets`
+ENCODED = PacketMetrics()  # server packets, by `packets.write_packet`
+
+DECODE_SECONDS = Histogram()  # per request body
+
+
+def format_value(value: float) -> str:
+    if isinstance(value, int):
+        return str(value)
+
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+
+    return repr(float(value))
+
+
+def escape(label_value: str) -> str:
+    return label_value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels: Optional[dict[str, str]]) -> str:
+    if not labels:
+        return ""
+
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in labels.items()) + "}"
+
+
+class Exposition:
+    """Builds a Prometheus text format page, one metric family at a time."""
+
+    def __init__(self) -> None:
+        self.lines: list[str] = []
+
+    def family(self, name: str, kind: str, help: str) -> None:
+        self.lines.append(f"# HELP {name} {help}")
+        self.lines.append(f"# TYPE {name} {kind}")
+
+    def sample(
+        self, name: str, value: float, labels: Optional[dict[str, str]] = None
+    ) -> None:
+        self.lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+
+    def gauge(self, name: str, help: str, value: float) -> None:
+        self.family(name, "gauge", help)
+        self.sample(name, value)
+
+    def counter(self, name: str, help: str, value: float) -> None:
+        self.family(name, "counter", help)
+        self.sample(name, value)
+
+    def labelled(
+        self,
+        name: str,
+        kind: str,
+        help: str,
+        samples: Iterable[tuple[dict[str, str], float]],
+    ) -> None:
+        self.family(name, kind, help)
+
+        for labels, value in samples:
+            self.sample(name, value, labels)
+
+    def histogram(
+        self,
+        name: str,
+        histogram: Histogram,
+        labels: Optional[dict[str, str]] = None,
+    ) -> None:
+        """Only the samples, `family` has to be called once before."""
+        labels = labels or {}
+        cumulative = 0
+
+        for bound, count in zip((*histogram.bounds, math.inf), histogram.counts):
+            cumulative += count
+            self.sample(
+                f"{name}_bucket", cumulative, {**labels, "le": format_value(bound)}
+            )
+
+        self.sample(f"{name}_sum", histogram.total, labels)
+        self.sample(f"{name}_count", cumulative, labels)
+
+    def text(self) -> str:
+        return "\n".join(self.lines) + "\n"
@@ -0,0 +1,72 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+
+class AdmissionRejected(Exception):
+    pass
+
+
+class AdmissionController:
+    """Bounds how many logins run at once.
+
+    Up to `max_concurrent` callers are admitted, up to `max_queued` more wait
+    for at most `max_wait` seconds, everyone else is rejected right away.
+    Requests from sessions that are already logged in never go through here,
+    so they are never stuck behind a wave of logins."""
+
+    def __init__(self, max_concurrent: int, max_queued: int, max_wait: float) -> None:
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.max_wait = max_wait
+
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+
+        self.active = 0
+        self.queued = 0
+
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.waited = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    async def wait_for_slot(self) -> None:
+        if self.queued >= self.max_queued:
+            self.rejected += 1
+            raise AdmissionRejected("login queue is full")
+
+        self.queued += 1
+        self.waited += 1
+        started = time.perf_counter()
+
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), self.max_wait)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise AdmissionRejected("timed out waiting in the login queue")
+        finally:
+            self.queued -= 1
+
+            wait_time = time.perf_counter() - started
+            self.wait_time_total += wait_time
+            self.wait_time_max = max(self.wait_time_max, wait_time)
+
+    @asynccontextmanager
+    async def __call__(self) -> AsyncIterator[None]:
+        if not self.semaphore.locked():
+            # a free slot, acquiring won't wait
+            await self.semaphore.acquire()
+        else:
+            await self.wait_for_slot()
+
+        self.admitted += 1
+        self.active += 1
+
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self.semaphore.release()
@@ -0,0 +1,56 @@
+from collections import OrderedDict
+from typing import Generic, Hashable, Optional, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class LRUCache(Generic[K, V]):
+    """A bounded mapping that evicts the least recently used entry."""
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self.entries: OrderedDict[K, V] = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self.entries
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def get(self, key: K) -> Optional[V]:
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: K, value: V) -> Optional[tuple[K, V]]:
+        """Stores `value`, returns the evicted entry if the cache was full."""
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+
+        if len(self.entries) <= self.max_size:
+            return None
+
+        self.evictions += 1
+        return self.entries.popitem(last=False)
+
+    def pop(self, key: K) -> Optional[V]:
+        return self.entries.pop(key, None)
+
+    def clear(self) -> None:
+        self.entries.clear()
@@ -5,6 +5,8 @@ from objects.session import Session
 
 
 class Channel:
+    __slots__ = ("name", "description", "auto_join", "privileges", "sessions")
+
     def __init__(
         self,
         name: str,
@@ -1,8 +1,14 @@
-from typing import TYPE_CHECKING, Any, Callable, Optional, Sequence
+import heapq
+import time
+from typing import TYPE_CHECKING, Any, Callable, Iterator, Optional, Sequence
 
 import packets
+import utils
+from objects.cache import LRUCache
 from objects.channels import Channel
-from objects.matches import Match
+from objects.matches import MAX_MATCH_ID, Match
+from objects.presence import PresenceSnapshot
+from objects.session import AccountRecord
 
 if TYPE_CHECKING:
     from objects.session import Session
@@ -20,6 +26,23 @@ class Channels(list[Channel]):
     def add(self, channel: Channel) -> None:
         self.append(channel)
 
+    def restore(self, channels: list[Channel]) -> None:
+        """Puts back the channels in a `StateSnapshot`, keeping the current
+        definitions of channels that exist in both."""
+        for restored_channel in channels:
+            channel = self.get_from_name(restored_channel.name)
+
+            if channel is None:
+                self.add(restored_channel)
+                continue
+
+            channel.sessions = restored_channel.sessions
+
+            for session in channel.sessions:
+                session.channels_in = [
+                    channel if c is restored_channel else c for c in session.channels_in
+                ]
+
     @classmethod
     def from_channels(cls, channel_list: list[Channel]) -> "Channels":
         channels = cls()
@@ -31,6 +54,8 @@ class Sessions(list["Session"]):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
+        self.presence = PresenceSnapshot()
+
     def __len__(self) -> int:
         no_bot = [sess for sess in self if not sess.is_bot]
         return len(no_bot)
@@ -92,37 +117,186 @@ class Sessions(list["Session"]):
 
             session.osu_client.pending_packets += data
 
+    def remove(self, session: "Session") -> None:
+        super().remove(session)
+        self.presence.remove(session.account.user_id)
+
+    def update_presence(self, user_id: int, presence: bytes) -> None:
+        """`presence` being the user's `packets.pack_osu_session`."""
+        self.presence.update(user_id, presence)
+
+    def remove_presence(self, user_id: int) -> None:
+        self.presence.remove(user_id)
+
+    def restore(self, sessions: list["Session"], presence: dict[int, bytes]) -> None:
+        """Puts back the sessions and presence in a `StateSnapshot`."""
+        self.extend(sessions)
+
+        for user_id, user_presence in presence.items():
+            self.presence.add(user_id, user_presence)
+
     def collect_all_sessions_for(self, session: "Session") -> bytes:
-        data = bytearray()
+        return self.presence.without(session.account.user_id)
 
-        user_id = session.account.user_id
 
-        for session in self:
-            if session.account.user_id == user_id:
-                continue
+class Matches:
+    """Active matches by id, for at most `capacity` matches at once.
 
-            data += packets.pack_osu_session(session)
+    Ids go from 1 to `capacity` and are reused, lowest first,
+    once their match is removed."""
 
-        return bytes(data)
+    def __init__(self, capacity: int) -> None:
+        if not 0 < capacity <= MAX_MATCH_ID:
+            raise ValueError(f"match capacity must be between 1 and {MAX_MATCH_ID}")
 
+        self.capacity = capacity
+        self.matches: dict[int, Match] = {}
 
-class Matches(list[Optional[Match]]):
-    def __init__(self, *args, **kwargs):
-        super().__init__([None] * 64)
+        # every match's NEW_MATCH, sent as is to sessions joining the lobby
+        self.listing: Optional[bytes] = None
+
+        # a sorted list is already a heap
+        self.free_ids: list[int] = list(range(1, capacity + 1))
 
     def __len__(self) -> int:
-        active_matches = [match for match in self if match is not None]
-        return len(active_matches)
+        return len(self.matches)
 
-    def get_free_spot(self) -> Optional[int]:
-        for index, spot in enumerate(self):
-            if spot is None:
-                return index
+    def __iter__(self) -> Iterator[Match]:
+        return iter(self.matches.values())
+
+    def get_from_id(self, match_id: int) -> Optional[Match]:
+        return self.matches.get(match_id)
+
+    def get_free_id(self) -> Optional[int]:
+        return self.free_ids[0] if self.free_ids else None
 
     def add(self, match: Match) -> None:
-        spot = self.get_free_spot()
+        """`match.id` has to be free, usually it's `get_free_id()`."""
+        if self.free_ids and self.free_ids[0] == match.id:
+            heapq.heappop(self.free_ids)
+        else:
+            self.free_ids.remove(match.id)  # raises if the id is taken
+            heapq.heapify(self.free_ids)
+
+        self.matches[match.id] = match
+        self.listing = None
+
+    def remove(self, match: Match) -> None:
+        if self.matches.pop(match.id, None) is not None:
+            heapq.heappush(self.free_ids, match.id)
+            self.listing = None
+
+    def changed(self, match: Match) -> None:
+        """Invalidates `match` and the lobby listing it's part of.
+
+        For code outside `Match` that changes what the lobby shows of it."""
+        match.invalidate()
+        self.listing = None
+
+    def lobby_listing(self) -> bytes:
+        if self.listing is None:
+            self.listing = b"".join(packets.new_match(match) for match in self)
+
+        return self.listing
+
+    def restore(self, matches: list[Match]) -> None:
+        """Puts back the matches in a `StateSnapshot`."""
+        for match in matches:
+            self.add(match)
+
+
+class Lobby:
+    """Sessions that joined the multiplayer lobby, by cho token.
+
+    They get every NEW_MATCH, UPDATE_MATCH and DISPOSE_MATCH."""
+
+    def __init__(self) -> None:
+        self.sessions: dict[str, "Session"] = {}
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    def __iter__(self) -> Iterator["Session"]:
+        return iter(self.sessions.values())
+
+    def __contains__(self, session: "Session") -> bool:
+        return session.cho_token in self.sessions
+
+    def add(self, session: "Session") -> None:
+        self.sessions[session.cho_token] = session
+
+    def remove(self, session: "Session") -> None:
+        self.sessions.pop(session.cho_token, None)
+
+
+class Accounts:
+    """LRU cache of account records, looked up by id or normalized user name.
+
+    Anything in this process that writes an account to the database must
+    `remove` it here, like `routers.cho.update_account`. Records expire after `ttl` seconds, which bounds how
+    long writes from elsewhere, another worker or an admin tool, go unseen."""
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self.ttl = ttl
+
+        # user id -> (record, expires at)
+        self.records: LRUCache[int, tuple[AccountRecord, float]] = LRUCache(max_size)
+        self.user_ids: dict[str, int] = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    @property
+    def evictions(self) -> int:
+        return self.records.evictions
+
+    def get_from_user_id(self, user_id: int) -> Optional[AccountRecord]:
+        entry = self.records.get(user_id)
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        account, expires_at = entry
+
+        if expires_at < time.monotonic():
+            self.remove(user_id)
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return account
+
+    def get_from_user_name(self, user_name: str) -> Optional[AccountRecord]:
+        user_id = self.user_ids.get(utils.normalize_user_name(user_name))
+
+        if user_id is None:
+            self.misses += 1
+            return None
+
+        return self.get_from_user_id(user_id)
+
+    def add(self, account: AccountRecord) -> None:
+        self.remove(account.id)
+
+        self.user_ids[utils.normalize_user_name(account.user_name)] = account.id
+
+        evicted = self.records.set(account.id, (account, time.monotonic() + self.ttl))
+        if evicted is not None:
+            _, (evicted_account, _) = evicted
+            del self.user_ids[utils.normalize_user_name(evicted_account.user_name)]
 
-        if spot is None:
-            raise Exception("no free spots")
+    def remove(self, user_id: int) -> None:
+        entry = self.records.pop(user_id)
 
-        self[spot] = match
+        if entry is not None:
+            account, _ = entry
+            del self.user_ids[utils.normalize_user_name(account.user_name)]
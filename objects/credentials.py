@@ -0,0 +1,66 @@
+import hashlib
+import hmac
+import secrets
+import time
+from typing import Optional
+
+from objects.cache import LRUCache
+from objects.session import AccountRecord
+
+
+class CredentialCache:
+    """Remembers recently verified passwords, so quick reconnects skip argon2.
+
+    Only a keyed hash of the password is kept, under a key that never
+    leaves the process. Entries expire after `ttl` seconds, and never
+    match once the account's argon2 hash has changed."""
+
+    def __init__(self, ttl: float, max_size: int) -> None:
+        self.ttl = ttl
+        self.key = secrets.token_bytes(32)
+
+        # user id -> (keyed pass_md5 hash, pass_argon2, expires at)
+        self.entries: LRUCache[int, tuple[bytes, str, float]] = LRUCache(max_size)
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def hash_password(self, pass_md5: str) -> bytes:
+        return hashlib.blake2b(pass_md5.encode(), key=self.key).digest()
+
+    def verified(self, account: AccountRecord, pass_md5: str) -> bool:
+        entry = self.entries.get(account.id)
+
+        if entry is None:
+            self.misses += 1
+            return False
+
+        pass_hash, pass_argon2, expires_at = entry
+
+        if expires_at < time.monotonic() or pass_argon2 != account.pass_argon2:
+            self.entries.pop(account.id)
+            self.misses += 1
+            return False
+
+        if not hmac.compare_digest(pass_hash, self.hash_password(pass_md5)):
+            self.misses += 1
+            return False
+
+        self.hits += 1
+        return True
+
+    def add(self, account: AccountRecord, pass_md5: str) -> None:
+        self.entries.set(
+            account.id,
+            (
+                self.hash_password(pass_md5),
+                account.pass_argon2,
+                time.monotonic() + self.ttl,
+            ),
+        )
+
+    def remove(self, user_id: int) -> Optional[tuple[bytes, str, float]]:
+        return self.entries.pop(user_id)
@@ -0,0 +1,624 @@
+import asyncio
+import enum
+import struct
+from dataclasses import dataclass
+from typing import Callable, NamedTuple, Optional
+
+import packets
+import utils
+
+
+@enum.unique
+class TopicKind(enum.IntEnum):
+    GLOBAL = 0
+    USER = 1  # key: user id
+    CHANNEL = 2  # key: channel name
+    MATCH = 3  # key: match id
+
+    # sent to everyone, like GLOBAL, but also kept in `Sessions.presence`
+    PRESENCE = 4  # key: user id
+    LOGOUT = 5  # key: user id
+
+    LOBBY = 6  # sessions in the multiplayer lobby
+
+
+class Topic(NamedTuple):
+    kind: TopicKind
+    key: str = ""
+
+
+GLOBAL_TOPIC = Topic(TopicKind.GLOBAL)
+LOBBY_TOPIC = Topic(TopicKind.LOBBY)
+
+
+def user_topic(user_id: int) -> Topic:
+    return Topic(TopicKind.USER, str(user_id))
+
+
+def channel_topic(channel_name: str) -> Topic:
+    return Topic(TopicKind.CHANNEL, channel_name)
+
+
+def match_topic(match_id: int) -> Topic:
+    return Topic(TopicKind.MATCH, str(match_id))
+
+
+def presence_topic(user_id: int) -> Topic:
+    return Topic(TopicKind.PRESENCE, str(user_id))
+
+
+def logout_topic(user_id: int) -> Topic:
+    return Topic(TopicKind.LOGOUT, str(user_id))
+
+
+# a match, its channel and the lobby listing it only exist in the worker that
+# made the match, and so do the spectators of a host with their channel.
+# match ids and channel names aren't unique across workers either
+LOCAL_TOPIC_KINDS = (TopicKind.MATCH, TopicKind.LOBBY)
+LOCAL_CHANNEL_PREFIXES = ("#match_", "#spec_")
+
+
+def is_local(topic: Topic) -> bool:
+    """Whether `topic` is only ever delivered in the worker publishing it."""
+    if topic.kind in LOCAL_TOPIC_KINDS:
+        return True
+
+    return topic.kind == TopicKind.CHANNEL and topic.key.startswith(
+        LOCAL_CHANNEL_PREFIXES
+    )
+
+
+@dataclass
+class DirectoryEntry:
+    token: str
+    worker_id: int
+    user_id: int
+    user_name: str
+
+
+class SessionDirectory:
+    """Every online session, in any worker, by cho token, user id and user name."""
+
+    def __init__(self) -> None:
+        self.entries: dict[str, DirectoryEntry] = {}
+        self.user_ids: dict[int, str] = {}
+        self.user_names: dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def add(self, entry: DirectoryEntry) -> None:
+        self.entries[entry.token] = entry
+        self.user_ids[entry.user_id] = entry.token
+        self.user_names[utils.normalize_user_name(entry.user_name)] = entry.token
+
+    def remove(self, token: str) -> Optional[DirectoryEntry]:
+        entry = self.entries.pop(token, None)
+        if entry is None:
+            return None
+
+        if self.user_ids.get(entry.user_id) == token:
+            del self.user_ids[entry.user_id]
+
+        user_name = utils.normalize_user_name(entry.user_name)
+        if self.user_names.get(user_name) == token:
+            del self.user_names[user_name]
+
+        return entry
+
+    def remove_other_workers(self, worker_id: int) -> list[DirectoryEntry]:
+        tokens = [e.token for e in self.entries.values() if e.worker_id != worker_id]
+        return [entry for token in tokens if (entry := self.remove(token))]
+
+    def get_from_token(self, token: str) -> Optional[DirectoryEntry]:
+        return self.entries.get(token)
+
+    def get_from_user_id(self, user_id: int) -> Optional[DirectoryEntry]:
+        token = self.user_ids.get(user_id)
+        return self.entries[token] if token is not None else None
+
+    def get_from_user_name(self, user_name: str) -> Optional[DirectoryEntry]:
+        token = self.user_names.get(utils.normalize_user_name(user_name))
+        return self.entries[token] if token is not None else None
+
+
+# messages between workers, each framed as a u32 length and then the body
+PUBLISH = 0  # topic kind, key, excluded token, packet data
+REGISTER = 1  # worker id, user id, token, user name
+UNREGISTER = 2  # token
+HELLO = 3  # worker id, sent once when a worker connects
+CLAIM = 4  # like REGISTER, the broker only registers it if the user is offline
+CLAIMED = 5  # accepted, token, the broker's answer to a CLAIM
+
+FRAME_HEADER = struct.Struct("<I")
+PUBLISH_HEADER = struct.Struct("<BBHH")
+REGISTER_HEADER = struct.Struct("<BHiHH")
+UNREGISTER_HEADER = struct.Struct("<BH")
+HELLO_HEADER = struct.Struct("<BH")
+CLAIMED_HEADER = struct.Struct("<BBH")
+
+# seconds a login waits on the broker to answer its claim
+CLAIM_TIMEOUT = 5.0
+
+
+class BusUnavailable(Exception):
+    """The broker couldn't be asked, or didn't answer in time."""
+
+
+def encode_publish(topic: Topic, data: bytes, excluded_token: str = "") -> bytes:
+    key = topic.key.encode()
+    token = excluded_token.encode()
+    body_length = PUBLISH_HEADER.size + len(key) + len(token) + len(data)
+
+    return b"".join(
+        (
+            FRAME_HEADER.pack(body_length),
+            PUBLISH_HEADER.pack(PUBLISH, topic.kind, len(key), len(token)),
+            key,
+            token,
+            data,
+        )
+    )
+
+
+def encode_register(entry: DirectoryEntry, kind: int = REGISTER) -> bytes:
+    """A REGISTER, or a CLAIM with the same body."""
+    token = entry.token.encode()
+    user_name = entry.user_name.encode()
+    body_length = REGISTER_HEADER.size + len(token) + len(user_name)
+
+    return b"".join(
+        (
+            FRAME_HEADER.pack(body_length),
+            REGISTER_HEADER.pack(
+                kind, entry.worker_id, entry.user_id, len(token), len(user_name)
+            ),
+            token,
+            user_name,
+        )
+    )
+
+
+def encode_unregister(token: str) -> bytes:
+    encoded_token = token.encode()
+
+    return b"".join(
+        (
+            FRAME_HEADER.pack(UNREGISTER_HEADER.size + len(encoded_token)),
+            UNREGISTER_HEADER.pack(UNREGISTER, len(encoded_token)),
+            encoded_token,
+        )
+    )
+
+
+def encode_claimed(token: str, accepted: bool) -> bytes:
+    encoded_token = token.encode()
+
+    return b"".join(
+        (
+            FRAME_HEADER.pack(CLAIMED_HEADER.size + len(encoded_token)),
+            CLAIMED_HEADER.pack(CLAIMED, accepted, len(encoded_token)),
+            encoded_token,
+        )
+    )
+
+
+def encode_hello(worker_id: int) -> bytes:
+    return FRAME_HEADER.pack(HELLO_HEADER.size) + HELLO_HEADER.pack(HELLO, worker_id)
+
+
+def decode_register(body: bytes) -> DirectoryEntry:
+    _, worker_id, user_id, token_length, user_name_length = REGISTER_HEADER.unpack_from(
+        body
+    )
+    offset = REGISTER_HEADER.size
+
+    return DirectoryEntry(
+        token=body[offset : offset + token_length].decode(),
+        worker_id=worker_id,
+        user_id=user_id,
+        user_name=body[
+            offset + token_length : offset + token_length + user_name_length
+        ].decode(),
+    )
+
+
+def decode_unregister(body: bytes) -> str:
+    _, token_length = UNREGISTER_HEADER.unpack_from(body)
+    return body[UNREGISTER_HEADER.size : UNREGISTER_HEADER.size + token_length].decode()
+
+
+def decode_claimed(body: bytes) -> tuple[str, bool]:
+    _, accepted, token_length = CLAIMED_HEADER.unpack_from(body)
+    offset = CLAIMED_HEADER.size
+
+    return body[offset : offset + token_length].decode(), bool(accepted)
+
+
+async def read_frame(reader: asyncio.StreamReader) -> bytes:
+    (length,) = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+    return await reader.readexactly(length)
+
+
+class EventBackend:
+    """Forwards bus messages to other workers, this one has none (single process)."""
+
+    # whether messages have to be encoded for `send` at all
+    relays = False
+
+    @property
+    def connected(self) -> bool:
+        return True
+
+    async def start(self, bus: "EventBus") -> None:
+        return None
+
+    async def stop(self) -> None:
+        return None
+
+    def send(self, frame: bytes) -> None:
+        return None
+
+
+# seconds, doubled after every failed attempt
+RECONNECT_DELAY = 0.5
+MAX_RECONNECT_DELAY = 10.0
+
+
+class UnixSocketBackend(EventBackend):
+    """Connects to an `EventBroker` over a unix socket, which relays messages
+    between every worker process on this machine.
+
+    A lost connection is retried until it's back, messages sent meanwhile
+    are dropped and the bus resyncs once it reconnects."""
+
+    relays = True
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.bus: Optional["EventBus"] = None
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.task: Optional[asyncio.Task] = None
+
+    async def start(self, bus: "EventBus") -> None:
+        self.bus = bus
+        await self.connect()
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+            self.task = None
+
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    @property
+    def connected(self) -> bool:
+        return self.writer is not None
+
+    def send(self, frame: bytes) -> None:
+        if self.writer is not None:
+            self.writer.write(frame)
+
+    async def connect(self) -> None:
+        assert self.bus is not None
+
+        self.reader, self.writer = await asyncio.open_unix_connection(self.path)
+        self.bus.connected()
+
+    async def run(self) -> None:
+        assert self.bus is not None and self.reader is not None
+
+        while True:
+            try:
+                while True:
+                    self.bus.receive(await read_frame(self.reader))
+            except (asyncio.IncompleteReadError, ConnectionError):
+                pass
+
+            if self.writer is not None:
+                self.writer.close()
+                self.writer = None
+
+            print("Lost the connection to the event broker, reconnecting")
+            self.bus.disconnected()
+
+            await self.reconnect()
+
+    async def reconnect(self) -> None:
+        delay = RECONNECT_DELAY
+
+        while True:
+            await asyncio.sleep(delay)
+
+            try:
+                await self.connect()
+            except OSError:
+                delay = min(delay * 2, MAX_RECONNECT_DELAY)
+                continue
+
+            print("Reconnected to the event broker")
+            return None
+
+
+# (topic, packet data, excluded token)
+Deliver = Callable[[Topic, bytes, Optional[str]], None]
+
+# a user in this worker's latest presence packet, if they have one
+Presence = Callable[[int], Optional[bytes]]
+
+
+class EventBus:
+    """Publishes packets to topics, every matching session in every worker gets them.
+
+    `deliver` hands packets to this worker's sessions, the backend
+    carries them (and session directory changes) to the other workers.
+    `presence` is sent again for this worker's sessions on every reconnect."""
+
+    def __init__(
+        self,
+        deliver: Deliver,
+        worker_id: int = 0,
+        backend: Optional[EventBackend] = None,
+        presence: Optional[Presence] = None,
+    ) -> None:
+        self.deliver = deliver
+        self.presence = presence
+        self.worker_id = worker_id
+        self.backend = backend or EventBackend()
+        self.directory = SessionDirectory()
+
+        # token -> whether the broker accepted its CLAIM, while a login waits
+        self.claims: dict[str, asyncio.Future[bool]] = {}
+
+        self.published = 0
+        self.received = 0
+
+    async def start(self) -> None:
+        await self.backend.start(self)
+
+    async def stop(self) -> None:
+        await self.backend.stop()
+
+    def publish(
+        self,
+        topic: Topic,
+        data: bytes,
+        excluded_token: Optional[str] = None,
+    ) -> None:
+        self.published += 1
+        self.deliver(topic, data, excluded_token)
+
+        if self.backend.relays and not is_local(topic):
+            self.backend.send(encode_publish(topic, data, excluded_token or ""))
+
+    def register(self, token: str, user_id: int, user_name: str) -> None:
+        entry = DirectoryEntry(token, self.worker_id, user_id, user_name)
+        self.directory.add(entry)
+        self.backend.send(encode_register(entry))
+
+    async def claim(self, token: str, user_id: int, user_name: str) -> bool:
+        """Registers a new session, unless its user is online in any worker.
+
+        The directory may not have heard of another worker's login yet, so
+        with other workers the broker decides, it sees every claim in order.
+        Raises `BusUnavailable` if the broker doesn't answer."""
+        existing = self.directory.get_from_user_id(user_id)
+        if existing is not None and existing.token != token:
+            return False
+
+        entry = DirectoryEntry(token, self.worker_id, user_id, user_name)
+
+        if not self.backend.relays:
+            self.directory.add(entry)
+            return True
+
+        if not self.backend.connected:
+            raise BusUnavailable("not connected to the event broker")
+
+        future = self.claims[token] = asyncio.get_running_loop().create_future()
+        self.backend.send(encode_register(entry, CLAIM))
+
+        try:
+            accepted = await asyncio.wait_for(future, CLAIM_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise BusUnavailable("the event broker didn't answer a claim") from None
+        finally:
+            del self.claims[token]
+
+        if accepted:
+            self.directory.add(entry)
+
+        return accepted
+
+    def unregister(self, token: str) -> None:
+        self.directory.remove(token)
+        self.backend.send(encode_unregister(token))
+
+    def connected(self) -> None:
+        """Called by the backend on every connect, the broker only knows this
+        worker's sessions and their presence once they're sent again."""
+        self.backend.send(encode_hello(self.worker_id))
+
+        for entry in list(self.directory.entries.values()):
+            if entry.worker_id != self.worker_id:
+                continue
+
+            self.backend.send(encode_register(entry))
+
+            presence = self.presence(entry.user_id) if self.presence else None
+            if presence is not None:
+                self.backend.send(
+                    encode_publish(presence_topic(entry.user_id), presence)
+                )
+
+    def disconnected(self) -> None:
+        """Called by the backend when it loses the broker. Every other worker's
+        sessions are logged out here, the broker sends them again on reconnect."""
+        for entry in self.directory.remove_other_workers(self.worker_id):
+            self.deliver(
+                logout_topic(entry.user_id), packets.logout(entry.user_id), None
+            )
+
+        # their claims were lost with the connection
+        for future in self.claims.values():
+            if not future.done():
+                future.set_exception(BusUnavailable("lost the event broker"))
+
+    def receive(self, body: bytes) -> None:
+        """Handles a message published by another worker."""
+        self.received += 1
+
+        if body[0] == PUBLISH:
+            _, kind, key_length, token_length = PUBLISH_HEADER.unpack_from(body)
+            offset = PUBLISH_HEADER.size
+
+            topic = Topic(TopicKind(kind), body[offset : offset + key_length].decode())
+            offset += key_length
+
+            excluded_token = body[offset : offset + token_length].decode() or None
+            offset += token_length
+
+            self.deliver(topic, body[offset:], excluded_token)
+        elif body[0] == REGISTER:
+            self.directory.add(decode_register(body))
+        elif body[0] == UNREGISTER:
+            self.directory.remove(decode_unregister(body))
+        elif body[0] == CLAIMED:
+            token, accepted = decode_claimed(body)
+            future = self.claims.get(token)
+
+            if future is not None and not future.done():
+                future.set_result(accepted)
+            elif accepted:
+                # the login stopped waiting, don't keep its user online
+                self.backend.send(encode_unregister(token))
+
+
+class EventBroker:
+    """Relays every message from one worker to all the others.
+
+    It also keeps the session directory and every user's latest presence,
+    so workers that (re)connect get every online session. A disconnected
+    worker's sessions are logged out in the others."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.writers: dict[asyncio.StreamWriter, int] = {}
+        self.directory = SessionDirectory()
+        self.server: Optional[asyncio.AbstractServer] = None
+
+        # user id -> the frame that published their latest presence
+        self.presence: dict[int, bytes] = {}
+
+    async def start(self) -> None:
+        self.server = await asyncio.start_unix_server(self.handle_worker, self.path)
+
+    async def stop(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+        for writer in list(self.writers):
+            writer.close()
+
+    def track_presence(self, body: bytes, frame: bytes) -> None:
+        kind = body[1]
+        if kind != TopicKind.PRESENCE and kind != TopicKind.LOGOUT:
+            return None
+
+        _, _, key_length, _ = PUBLISH_HEADER.unpack_from(body)
+        offset = PUBLISH_HEADER.size
+        user_id = int(body[offset : offset + key_length])
+
+        if kind == TopicKind.PRESENCE:
+            self.presence[user_id] = frame
+        else:
+            self.presence.pop(user_id, None)
+
+    def broadcast(self, frame: bytes, sender: asyncio.StreamWriter) -> None:
+        for writer in self.writers:
+            if writer is not sender:
+                writer.write(frame)
+
+    async def handle_worker(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        self.writers[writer] = -1
+
+        for entry in self.directory.entries.values():
+            writer.write(encode_register(entry))
+
+        for frame in self.presence.values():
+            writer.write(frame)
+
+        # this connection's sessions, a restarted worker may register
+        # the same tokens again before this one is noticed as closed
+        entries: dict[str, DirectoryEntry] = {}
+
+        try:
+            while True:
+                body = await read_frame(reader)
+                frame = FRAME_HEADER.pack(len(body)) + body
+
+                if body[0] == HELLO:
+                    _, self.writers[writer] = HELLO_HEADER.unpack_from(body)
+                    continue
+
+                if body[0] == PUBLISH:
+                    self.track_presence(body, frame)
+                elif body[0] == CLAIM:
+                    entry = decode_register(body)
+                    existing = self.directory.get_from_user_id(entry.user_id)
+                    accepted = existing is None or existing.token == entry.token
+
+                    writer.write(encode_claimed(entry.token, accepted))
+                    if not accepted:
+                        continue
+
+                    entries[entry.token] = entry
+                    self.directory.add(entry)
+
+                    # the other workers only need to know it was registered
+                    frame = encode_register(entry)
+                elif body[0] == REGISTER:
+                    entry = decode_register(body)
+                    entries[entry.token] = entry
+                    self.directory.add(entry)
+                elif body[0] == UNREGISTER:
+                    token = decode_unregister(body)
+                    entries.pop(token, None)
+                    self.directory.remove(token)
+
+                self.broadcast(frame, writer)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            del self.writers[writer]
+            writer.close()
+
+            for entry in entries.values():
+                if self.directory.get_from_token(entry.token) is not entry:
+                    continue
+
+                self.directory.remove(entry.token)
+                self.presence.pop(entry.user_id, None)
+
+                self.broadcast(encode_unregister(entry.token), writer)
+                self.broadcast(
+                    encode_publish(
+                        logout_topic(entry.user_id), packets.logout(entry.user_id)
+                    ),
+                    writer,
+                )
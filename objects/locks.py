@@ -0,0 +1,39 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Hashable
+
+
+class KeyedLock:
+    """A set of `asyncio.Lock`s created on demand, one per key.
+
+    Locks are dropped again once nobody holds or waits on them,
+    so memory only grows with the number of keys in use at once."""
+
+    def __init__(self) -> None:
+        self.locks: dict[Hashable, asyncio.Lock] = {}
+        self.users: dict[Hashable, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.locks)
+
+    def locked(self, key: Hashable) -> bool:
+        lock = self.locks.get(key)
+        return lock is not None and lock.locked()
+
+    @asynccontextmanager
+    async def __call__(self, key: Hashable) -> AsyncIterator[None]:
+        lock = self.locks.get(key)
+        if lock is None:
+            lock = self.locks[key] = asyncio.Lock()
+
+        self.users[key] = self.users.get(key, 0) + 1
+
+        try:
+            async with lock:
+                yield
+        finally:
+            self.users[key] -= 1
+
+            if not self.users[key]:
+                del self.users[key]
+                del self.locks[key]
@@ -1,14 +1,15 @@
 from dataclasses import dataclass
 
 
-@dataclass
+@dataclass(slots=True)
 class ClientDetails:
     osu_version: float
     osu_path_md5: str
     adapters_md5: str
     uninstall_md5: str
     disk_signature_md5: str
-    adapters: list[str]
+    # emptied once recorded, see routers.cho.record_client_details
+    adapters: tuple[str, ...]
 
     @classmethod
     def from_osu_client_login(
@@ -31,7 +32,7 @@ class ClientDetails:
             adapters_md5=adapters_md5,
             uninstall_md5=uninstall_md5,
             disk_signature_md5=disk_signature_md5,
-            adapters=adapters.split("."),
+            adapters=tuple(adapters.split(".")),
         )
 
 
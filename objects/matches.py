@@ -1,8 +1,8 @@
+from array import array
 from dataclasses import dataclass
 from typing import TYPE_CHECKING, Optional
 
 import utils
-from enums.game_mode import GameMode
 from enums.mods import Mods
 from enums.multiplayer import SlotStatus, Team, TeamTypes, WinConditions
 from objects.channels import Channel
@@ -11,37 +11,61 @@ if TYPE_CHECKING:
     import packets
     from objects.session import Session
 
+# ids are sent to the client as an u16
+MAX_MATCH_ID = 0xFFFF
 
-@dataclass
+SLOT_COUNT = 16
+NO_USER = 0  # in `Match.slot_user_ids`
+
+# barriers every player in a round passes, see `Match.arrive`
+LOADED = 0
+SKIPPED = 1
+COMPLETED = 2
+BARRIERS = (LOADED, SKIPPED, COMPLETED)
+
+
+@dataclass(slots=True)
 class MatchMapInfo:
     name: str  # map_
     id: int  # map_
     md5: str  # map_
 
 
-class Slot:
-    def __init__(
-        self,
-        mods: Mods = Mods.NOMOD,
-        user_id: Optional[int] = None,
-        status: SlotStatus = SlotStatus.OPEN,
-        team: Team = Team.NEUTRAL,
-    ) -> None:
-        self.mods = mods
-        self.status = status
-        self.team = team
-        self.user_id = user_id
-
-
 class Match:
+    __slots__ = (
+        "id",
+        "host_id",
+        "in_progress",
+        "free_mod",
+        "mods",
+        "game_mode",
+        "name",
+        "pass_word",
+        "current_map",
+        "previous_map",
+        "slot_statuses",
+        "slot_teams",
+        "slot_mods",
+        "slot_user_ids",
+        "user_slots",
+        "playing",
+        "arrived",
+        "released",
+        "win_condition",
+        "team_type",
+        "seed",
+        "channel",
+        "packets",
+    )
+
     def __init__(
         self,
         id: int,
         host_id: int,
         in_progress: bool,
         free_mod: bool,
-        game_mode: GameMode,
-        mods: Mods,
+        game_mode: int,  # GameMode
+        mods: int,  # Mods
         name: str,
         current_map: MatchMapInfo,
         pass_word: Optional[str] = None,
@@ -59,13 +83,36 @@ class Match:
         self.pass_word = pass_word
         self.current_map = current_map
         self.previous_map = previous_map
-        self.slots = [Slot() for _ in range(16)]
+
+        # one entry per slot, written to the client as is, see `packets.write_match`
+        self.slot_statuses = bytearray([SlotStatus.OPEN] * SLOT_COUNT)
+        self.slot_teams = bytearray([Team.NEUTRAL] * SLOT_COUNT)
+        self.slot_mods = array("I", [Mods.NOMOD] * SLOT_COUNT)
+        self.slot_user_ids = array("i", [NO_USER] * SLOT_COUNT)
+
+        self.user_slots: dict[int, int] = {}  # user id -> slot id
+
+        # bitmasks of slot ids, for the round in progress
+        self.playing = 0
+        self.arrived = [0] * len(BARRIERS)  # indexed by barrier
+        self.released = 0  # bitmask of barriers
+
         self.win_condition = win_condition
         self.team_type = team_type
         self.seed = 0
 
         self.channel: Channel
 
+        # (packet id, with pass word) -> encoded match, see `packets.match_packet`
+        self.packets: dict[tuple[int, bool], bytes] = {}
+
+    def invalidate(self) -> None:
+        """Drops the match's encoded packets, see `packets.match_packet`.
+
+        `Match` calls it itself, code changing fields from outside calls
+        `common.matches.changed`, which also clears the lobby listing."""
+        self.packets.clear()
+
     def init_channel(self) -> Channel:
         channel = Channel(
             name=f"#match_{self.id}",
@@ -77,14 +124,120 @@ class Match:
 
         return channel
 
+    @property
+    def is_empty(self) -> bool:
+        return not self.user_slots
+
+    @property
+    def user_ids(self) -> list[int]:
+        return list(self.user_slots)
+
+    def get_free_slot(self) -> Optional[int]:
+        slot_id = self.slot_statuses.find(SlotStatus.OPEN)
+        return slot_id if slot_id != -1 else None
+
+    def add_player(self, slot_id: int, user_id: int, team: Team = Team.NEUTRAL) -> None:
+        self.slot_statuses[slot_id] = SlotStatus.NOT_READY
+        self.slot_teams[slot_id] = team
+        self.slot_mods[slot_id] = Mods.NOMOD
+        self.slot_user_ids[slot_id] = user_id
+        self.user_slots[user_id] = slot_id
+
+        self.invalidate()
+
+    def remove_player(self, user_id: int) -> Optional[int]:
+        """Call `release` afterwards, the player may have held up a barrier."""
+        slot_id = self.user_slots.pop(user_id, None)
+        if slot_id is None:
+            return None
+
+        self.playing &= ~(1 << slot_id)
+
+        self.slot_statuses[slot_id] = SlotStatus.OPEN
+        self.slot_teams[slot_id] = Team.NEUTRAL
+        self.slot_mods[slot_id] = Mods.NOMOD
+        self.slot_user_ids[slot_id] = NO_USER
+
+        self.invalidate()
+        return slot_id
+
+    def start(self) -> bool:
+        """Starts a round with every player that has the map.
+
+        Nothing changes if no player has it, a round nobody plays never ends."""
+        playing = 0
+
+        for slot_id in self.user_slots.values():
+            if self.slot_statuses[slot_id] != SlotStatus.NO_MAP:
+                playing |= 1 << slot_id
+
+        if not playing:
+            return False
+
+        self.in_progress = True
+        self.playing = playing
+        self.arrived = [0] * len(BARRIERS)
+        self.released = 0
+
+        for slot_id in self.user_slots.values():
+            if playing & (1 << slot_id):
+                self.slot_statuses[slot_id] = SlotStatus.PLAYING
+
+        self.invalidate()
+        return True
+
+    def finish(self) -> None:
+        self.in_progress = False
+
+        for slot_id in self.user_slots.values():
+            if self.playing & (1 << slot_id):
+                self.slot_statuses[slot_id] = SlotStatus.NOT_READY
+
+        self.playing = 0
+        self.invalidate()
+
+    def arrive(self, barrier: int, slot_id: int) -> bool:
+        """Marks a player as past `barrier`, whether everyone playing now is.
+
+        True only once per barrier and round, for the last player to arrive."""
+        bit = 1 << slot_id
+        if not self.playing & bit:
+            return False
+
+        self.arrived[barrier] |= bit
+        return self.release(barrier)
+
+    def release(self, barrier: int) -> bool:
+        if not self.in_progress or self.released & (1 << barrier):
+            return False
+
+        if self.arrived[barrier] & self.playing != self.playing:
+            return False
+
+        self.released |= 1 << barrier
+        return True
+
+    def next_host(self, slot_id: int) -> int:
+        """The player in the first occupied slot after `slot_id`, wrapping around."""
+        for offset in range(1, SLOT_COUNT):
+            user_id = self.slot_user_ids[(slot_id + offset) % SLOT_COUNT]
+
+            if user_id != NO_USER:
+                return user_id
+
+        return NO_USER
+
     def remove_session(self, session: "Session") -> None:
-        for slot in self.slots:
-            if slot.user_id == session.account.user_id:
-                self.slots.remove(slot)
+        """Hands the match to the next player if `session` was its host."""
+        user_id = session.account.user_id
+        slot_id = self.remove_player(user_id)
 
-        session.leave_channel(self.channel)
+        if slot_id is not None and user_id == self.host_id and self.user_slots:
+            self.host_id = self.next_host(slot_id)
+            self.invalidate()
 
-        breakpoint()
+        session.leave_channel(self.channel)
+        session.match = None
 
     @classmethod
     def from_match_packet(
@@ -93,13 +246,13 @@ class Match:
         if match_id is None:
             match_id = match.id
 
-        mods, game_mode = utils.ensure_mods_and_gamemode(
+        mods, game_mode = utils.normalize_mods_and_mode(
             mods=match.mods,
             game_mode=match.game_mode,
         )
 
         match_map_info = MatchMapInfo(
-            name=match.name,
+            name=match.map_name,
             id=match.map_id,
             md5=match.map_md5,
         )
@@ -0,0 +1,73 @@
+class PresenceSnapshot:
+    """Every online user's encoded presence and stats, kept as one buffer.
+
+    Users are appended when they log in and patched in place when their
+    status changes without changing size. Anything else marks the buffer
+    stale, and it is compacted (joined, not re-encoded) on the next read."""
+
+    def __init__(self) -> None:
+        self.entries: dict[int, bytes] = {}
+        self.offsets: dict[int, int] = {}
+        self.data = bytearray()
+        self.stale = False
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self.entries
+
+    def add(self, user_id: int, presence: bytes) -> None:
+        if user_id in self.entries:
+            return self.update(user_id, presence)
+
+        self.entries[user_id] = presence
+
+        if not self.stale:
+            self.offsets[user_id] = len(self.data)
+            self.data += presence
+
+    def update(self, user_id: int, presence: bytes) -> None:
+        previous_presence = self.entries.get(user_id)
+        if previous_presence is None:
+            return self.add(user_id, presence)
+
+        self.entries[user_id] = presence
+
+        if self.stale:
+            return None
+
+        if len(previous_presence) == len(presence):
+            offset = self.offsets[user_id]
+            self.data[offset : offset + len(presence)] = presence
+        else:
+            self.stale = True
+
+    def remove(self, user_id: int) -> None:
+        if self.entries.pop(user_id, None) is not None:
+            self.stale = True
+
+    def compact(self) -> None:
+        self.offsets.clear()
+
+        offset = 0
+        for user_id, presence in self.entries.items():
+            self.offsets[user_id] = offset
+            offset += len(presence)
+
+        self.data = bytearray().join(self.entries.values())
+        self.stale = False
+
+    def without(self, user_id: int) -> bytes:
+        """Everyone's presence, except for `user_id`'s."""
+        if self.stale:
+            self.compact()
+
+        offset = self.offsets.get(user_id)
+        if offset is None:
+            return bytes(self.data)
+
+        end = offset + len(self.entries[user_id])
+
+        with memoryview(self.data) as data:
+            return b"".join((data[:offset], data[end:]))
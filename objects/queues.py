@@ -0,0 +1,103 @@
+import asyncio
+import time
+from typing import Callable, Generic, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class WriteBehindQueue(Generic[T]):
+    """Buffers database writes and flushes them in batches from a background task.
+
+    `flush` is called from a worker thread with at most `max_batch_size` items,
+    every `flush_interval` seconds or as soon as a full batch is waiting.
+    Past `max_size` buffered items the oldest ones are dropped."""
+
+    def __init__(
+        self,
+        name: str,
+        flush: Callable[[list[T]], None],
+        max_batch_size: int = 500,
+        flush_interval: float = 1.0,
+        max_size: int = 100_000,
+    ) -> None:
+        self.name = name
+        self.flush = flush
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+
+        self.items: list[T] = []
+        self.wakeup = asyncio.Event()
+        self.flushing = asyncio.Lock()  # batches are written in order
+        self.task: Optional[asyncio.Task] = None
+
+        self.flushed = 0
+        self.batches = 0
+        self.dropped = 0
+        self.failures = 0
+        self.last_flush_duration = 0.0
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def put(self, item: T) -> None:
+        self.items.append(item)
+
+        if len(self.items) > self.max_size:
+            overflow = len(self.items) - self.max_size
+            del self.items[:overflow]
+            self.dropped += overflow
+
+        if len(self.items) >= self.max_batch_size:
+            self.wakeup.set()
+
+    async def flush_pending(self) -> None:
+        async with self.flushing:
+            await self.flush_items()
+
+    async def flush_items(self) -> None:
+        while self.items:
+            batch = self.items[: self.max_batch_size]
+            del self.items[: self.max_batch_size]
+
+            started = time.perf_counter()
+
+            try:
+                await asyncio.to_thread(self.flush, batch)
+            except Exception as e:
+                # put the batch back and try again on the next interval
+                self.items[:0] = batch
+                self.failures += 1
+                print(f"Failed to flush {len(batch)} {self.name} writes: {e!r}")
+                return None
+
+            self.last_flush_duration = time.perf_counter() - started
+            self.flushed += len(batch)
+            self.batches += 1
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+
+            self.wakeup.clear()
+            await self.flush_pending()
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """Stops the background task and drains whatever is still buffered."""
+        if self.task is not None:
+            self.task.cancel()
+
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+            self.task = None
+
+        await self.flush_pending()
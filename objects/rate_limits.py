@@ -0,0 +1,62 @@
+import time
+from typing import Hashable
+
+from objects.cache import LRUCache
+
+
+class RateLimiter:
+    """A token bucket per key: `burst` requests at once, refilled at `rate` per second.
+
+    Buckets live in an LRU, so at most `max_keys` are tracked at a time."""
+
+    def __init__(self, rate: float, burst: int, max_keys: int) -> None:
+        self.rate = rate
+        self.burst = burst
+
+        # key -> [tokens, last refill]
+        self.buckets: LRUCache[Hashable, list[float]] = LRUCache(max_keys)
+
+        self.allowed = 0
+        self.limited = 0
+
+    def __len__(self) -> int:
+        return len(self.buckets)
+
+    def tokens(self, key: Hashable, now: float) -> list[float]:
+        """`key`'s bucket, refilled up to `now`."""
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = [float(self.burst), now]
+            self.buckets.set(key, bucket)
+            return bucket
+
+        bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        return bucket
+
+    def allow(self, key: Hashable) -> bool:
+        bucket = self.tokens(key, time.monotonic())
+
+        if bucket[0] < 1:
+            self.limited += 1
+            return False
+
+        bucket[0] -= 1
+        self.allowed += 1
+        return True
+
+    def exhausted(self, key: Hashable) -> bool:
+        """Like `allow`, without taking a token, see `charge`."""
+        bucket = self.buckets.get(key)
+
+        if bucket is None or self.tokens(key, time.monotonic())[0] >= 1:
+            self.allowed += 1
+            return False
+
+        self.limited += 1
+        return True
+
+    def charge(self, key: Hashable) -> None:
+        """Takes a token from `key`'s bucket, for requests that turned out bad."""
+        bucket = self.tokens(key, time.monotonic())
+        bucket[0] = max(bucket[0] - 1, 0.0)
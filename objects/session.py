@@ -1,3 +1,4 @@
+import dataclasses
 import uuid
 from dataclasses import dataclass, field
 from typing import TYPE_CHECKING, Any, Optional
@@ -7,9 +8,12 @@ import packets
 from enums.actions import ActionType
 from enums.game_mode import GameMode
 from enums.mods import Mods
-from enums.multiplayer import SlotStatus, Team, TeamTypes
+from enums.multiplayer import Team, TeamTypes
 from enums.presence import PresenceFilter
-from enums.privileges import ClientPrivileges, ServerPrivileges
+from enums.privileges import (
+    SERVER_TO_CLIENT_PRIVILEGES,
+    ServerPrivileges,
+)
 from objects.command import Command, Context
 from objects.login import ClientDetails
 
@@ -22,14 +26,14 @@ if TYPE_CHECKING:
 USER_ID = int
 
 
-@dataclass
+@dataclass(slots=True)
 class Status:
     action: ActionType
     info_text: str
     map_id: int
     map_md5: str
-    mode: GameMode
-    mods: Mods
+    mode: int  # GameMode, kept as a plain int
+    mods: int  # Mods, kept as a plain int
 
 
 DEFAULT_STATUS = Status(
@@ -42,22 +46,57 @@ DEFAULT_STATUS = Status(
 )
 
 
-@dataclass
+@dataclass(slots=True)
 class Account:
     user_id: int
     user_name: str
-    friends: list[USER_ID]
+    friends: set[USER_ID]
     country_code: str
 
 
+@dataclass(slots=True)
+class AccountRecord:
+    """A database account row, as kept in `common.accounts`."""
+
+    id: int
+    user_name: str
+    pass_argon2: str
+    friends: set[USER_ID]
+    country_code: str
+    privileges: int
+
+    def as_account_session(self) -> Account:
+        # the friends set is shared, sessions update it in place
+        return Account(
+            user_id=self.id,
+            user_name=self.user_name,
+            friends=self.friends,
+            country_code=self.country_code,
+        )
+
+
 class OsuClient:
+    __slots__ = (
+        "details",
+        "status",
+        "presence_filter",
+        "pending_packets",
+    )
+
     def __init__(
         self,
         details: ClientDetails,
-        status: Status = DEFAULT_STATUS,
+        status: Optional[Status] = None,
         presence_filter: PresenceFilter = PresenceFilter.All,
-        pending_packets: bytearray = bytearray(),
+        pending_packets: Optional[bytearray] = None,
     ) -> None:
+        # never share the defaults, both are updated in place
+        if status is None:
+            status = dataclasses.replace(DEFAULT_STATUS)
+
+        if pending_packets is None:
+            pending_packets = bytearray()
+
         self.details: ClientDetails = details
         self.status: Status = status
         self.presence_filter: PresenceFilter = presence_filter
@@ -78,9 +117,6 @@ class OsuClient:
         self.pending_packets += packets.match_join_fail()
         return None
 
-    def see_match(self, match: "Match") -> None:
-        breakpoint()
-
     def join_channel(self, channel: "Channel") -> None:
         channel_bytes = packets.channel_info(
             channel_name=channel.name,
@@ -105,28 +141,6 @@ class OsuClient:
         self.leave_channel_from_name(channel.name)
         return None
 
-    def server_to_client_privileges(
-        self, server_privileges: ServerPrivileges
-    ) -> ClientPrivileges:
-        client_privs = ClientPrivileges.Player
-
-        if server_privileges & ServerPrivileges.Normal:
-            client_privs |= ClientPrivileges.Supporter
-
-        if server_privileges & (ServerPrivileges.Admin | ServerPrivileges.Mod):
-            client_privs |= ClientPrivileges.Moderator
-
-        if server_privileges & ServerPrivileges.EventManager:
-            client_privs |= ClientPrivileges.Tournament
-
-        if server_privileges & ServerPrivileges.Developer:
-            client_privs |= ClientPrivileges.Developer
-
-        if server_privileges & ServerPrivileges.Owner:
-            client_privs |= ClientPrivileges.Owner
-
-        return client_privs
-
     def clear_pending_packets(self) -> bytearray:
         _queue = self.pending_packets.copy()
         self.pending_packets.clear()
@@ -136,7 +150,7 @@ class OsuClient:
         return constants.time.country_codes_to_osu_code[country_code]
 
 
-@dataclass
+@dataclass(slots=True)
 class Session:
     account: Account
     osu_client: OsuClient
@@ -148,6 +162,29 @@ class Session:
     channels_in: list["Channel"] = field(default_factory=list)
     match: Optional["Match"] = None
 
+    # spectating, sessions refer to each other so they're left out of eq and repr
+    spectating: Optional["Session"] = field(default=None, compare=False, repr=False)
+    spectators: dict[str, "Session"] = field(  # by cho token
+        default_factory=dict, compare=False, repr=False
+    )
+    spectator_channel: Optional["Channel"] = field(
+        default=None, compare=False, repr=False
+    )
+
+    # resolved once for every presence packet, see `set_privileges`
+    client_privileges: int = field(init=False)  # ClientPrivileges
+    country: int = field(init=False)  # osu! country code
+
+    def __post_init__(self) -> None:
+        self.set_privileges(self.privileges)
+        self.country = self.osu_client.country_code_to_client_code(
+            self.account.country_code
+        )
+
+    def set_privileges(self, privileges: ServerPrivileges) -> None:
+        self.privileges = privileges
+        self.client_privileges = SERVER_TO_CLIENT_PRIVILEGES[privileges]
+
     def leave_match(self) -> None:
         if self.match is None:
             return None
@@ -165,25 +202,62 @@ class Session:
                 self.osu_client.joining_match_failed()
                 return None
 
-        avaliable_slots = [slot for slot in match.slots if slot.user_id is None]
+        slot_id = match.get_free_slot()
 
-        if not avaliable_slots:
+        if slot_id is None:
             self.osu_client.joining_match_failed()
             self.osu_client.notify("match is full")
             return None
 
-        slot = avaliable_slots[0]
-
-        slot.user_id = self.account.user_id
-        slot.status = SlotStatus.NOT_READY
-
         if match.team_type in (TeamTypes.TEAM_VS, TeamTypes.TAG_TEAM_VS):
-            slot.team = Team.RED
+            team = Team.RED
+        else:
+            team = Team.NEUTRAL
 
+        match.add_player(slot_id, self.account.user_id, team)
+        self.match = match
+
+        match.channel.add_session(self)
         self.channels_in.append(match.channel)
 
         self.osu_client.join_match(match)
 
+    def add_spectator(self, spectator: "Session") -> None:
+        """Lets the host and the other spectators know, `spectator_channel` must be set."""
+        user_id = spectator.account.user_id
+        joined = packets.fellow_spectator_joined(user_id)
+
+        for other in self.spectators.values():
+            other.osu_client.pending_packets += joined
+            spectator.osu_client.pending_packets += packets.fellow_spectator_joined(
+                other.account.user_id
+            )
+
+        self.osu_client.pending_packets += packets.spectator_joined(user_id)
+
+        self.spectators[spectator.cho_token] = spectator
+        spectator.spectating = self
+
+        assert self.spectator_channel is not None
+        spectator.join_channel(self.spectator_channel)
+
+    def remove_spectator(self, spectator: "Session") -> None:
+        if self.spectators.pop(spectator.cho_token, None) is None:
+            return None
+
+        spectator.spectating = None
+
+        if self.spectator_channel is not None:
+            spectator.leave_channel(self.spectator_channel)
+
+        user_id = spectator.account.user_id
+        left = packets.fellow_spectator_left(user_id)
+
+        for other in self.spectators.values():
+            other.osu_client.pending_packets += left
+
+        self.osu_client.pending_packets += packets.spectator_left(user_id)
+
     def join_channel(self, channel: "Channel") -> None:
         if self in channel:
             return None
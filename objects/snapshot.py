@@ -0,0 +1,81 @@
+import os
+import pickle
+import time
+import zlib
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from objects.channels import Channel
+    from objects.matches import Match
+    from objects.session import Session
+
+# bump whenever a pickled class changes shape
+SNAPSHOT_VERSION = 9
+
+
+@dataclass
+class StateSnapshot:
+    """A worker's sessions, channel memberships and matches, kept across a restart.
+
+    Everything is pickled in one go, so the references between sessions,
+    channels and matches come back as the same objects."""
+
+    version: int
+    worker_id: int
+    created: float
+
+    sessions: list["Session"]
+    presence: dict[int, bytes]  # user id -> `packets.pack_osu_session`
+    channels: list["Channel"]
+    matches: list["Match"]
+    lobby: list["Session"]
+
+
+def write_snapshot(path: str, snapshot: StateSnapshot) -> int:
+    data = zlib.compress(
+        pickle.dumps(snapshot, protocol=pickle.HIGHEST_PROTOCOL),
+        level=1,
+    )
+
+    # never leave a half written snapshot behind
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "wb") as f:
+        f.write(data)
+
+    os.replace(temporary_path, path)
+    return len(data)
+
+
+def read_snapshot(path: str, worker_id: int, max_age: float) -> Optional[StateSnapshot]:
+    """The snapshot at `path`, if it's usable. It's deleted either way,
+    a snapshot is only ever restored once.
+
+    Snapshots are only written by this server, they are trusted (pickle)."""
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+
+    os.remove(path)
+
+    try:
+        snapshot = pickle.loads(zlib.decompress(data))
+    except Exception as e:
+        print(f"Failed to read snapshot {path}: {e!r}")
+        return None
+
+    if not isinstance(snapshot, StateSnapshot) or snapshot.version != SNAPSHOT_VERSION:
+        print(f"Ignoring snapshot {path}, it's from another version")
+        return None
+
+    if snapshot.worker_id != worker_id:
+        print(f"Ignoring snapshot {path}, it's from worker {snapshot.worker_id}")
+        return None
+
+    if time.time() - snapshot.created > max_age:
+        print(f"Ignoring snapshot {path}, it's older than {max_age}s")
+        return None
+
+    return snapshot
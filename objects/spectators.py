@@ -0,0 +1,196 @@
+from collections import deque
+from itertools import islice
+
+
+class FrameBuffer:
+    """A host's latest spectate frame bundles, read by each spectator from its own cursor.
+
+    Cursors are bundle sequence numbers, bundles every spectator has read
+    are dropped right away. A spectator whose cursor is before `first`
+    lost bundles and is resynced to the oldest one still kept."""
+
+    __slots__ = ("bundles", "first", "size", "cursors", "readers", "lagging")
+
+    def __init__(self) -> None:
+        self.bundles: deque[bytes] = deque()
+        self.first = 0  # sequence number of bundles[0]
+        self.size = 0  # bytes
+
+        self.cursors: dict[str, int] = {}  # spectator token -> next bundle
+        self.readers: dict[int, int] = {}  # cursor -> spectators at it
+        self.lagging: set[str] = set()  # spectator tokens, once resynced
+
+    @property
+    def end(self) -> int:
+        return self.first + len(self.bundles)
+
+    def add_reader(self, token: str) -> None:
+        self.move(token, self.end)
+
+    def remove_reader(self, token: str) -> None:
+        cursor = self.cursors.pop(token, None)
+        if cursor is None:
+            return None
+
+        self.leave(cursor)
+        self.lagging.discard(token)
+        self.collect()
+
+    def append(self, bundle: bytes) -> None:
+        self.bundles.append(bundle)
+        self.size += len(bundle)
+
+    def pop(self) -> None:
+        self.size -= len(self.bundles.popleft())
+        self.first += 1
+
+    def read(self, token: str) -> tuple[bytes, bool]:
+        """The bundles `token` hasn't read yet, joined, and whether it lost some.
+
+        Called for every spectator on every poll, so `move` and `collect`
+        are inlined here."""
+        cursor = self.cursors[token]
+        first = self.first
+        end = first + len(self.bundles)
+
+        if cursor == end:
+            return b"", False
+
+        if cursor == end - 1:
+            data = self.bundles[-1]
+        else:
+            data = b"".join(islice(self.bundles, max(cursor - first, 0), None))
+
+        self.cursors[token] = end
+        readers = self.readers
+        readers[end] = readers.get(end, 0) + 1
+
+        count = readers[cursor] - 1
+        if count:
+            readers[cursor] = count
+        else:
+            del readers[cursor]
+
+        # nobody is holding back the oldest bundles anymore
+        if first not in readers:
+            self.collect()
+
+        return data, cursor < first
+
+    def move(self, token: str, cursor: int) -> None:
+        previous = self.cursors.get(token)
+        if previous is not None:
+            self.leave(previous)
+
+        self.cursors[token] = cursor
+        readers = self.readers
+        readers[cursor] = readers.get(cursor, 0) + 1
+
+    def leave(self, cursor: int) -> None:
+        count = self.readers[cursor] - 1
+        if count:
+            self.readers[cursor] = count
+        else:
+            del self.readers[cursor]
+
+    def collect(self) -> None:
+        # lagging spectators don't hold anything back, they're resynced anyway
+        while self.bundles and not self.readers.get(self.first):
+            self.pop()
+
+
+class FrameRelay:
+    """Every host's `FrameBuffer`, by host cho token, with their memory bounded.
+
+    A host's buffer never holds more than `max_host_size` bytes, which is
+    the furthest any spectator can fall behind. Past `max_size` bytes for
+    every host together, the host relaying trims its own buffer.
+
+    A read costs a few hundred nanoseconds more per spectator than copying
+    every bundle into each spectator's `pending_packets` would, see
+    `benchmarks.spectator_relay`. That's the price of a spectator that stops
+    polling costing at most `max_host_size` bytes, instead of growing forever."""
+
+    def __init__(self, max_size: int, max_host_size: int) -> None:
+        self.max_size = max_size
+        self.max_host_size = max_host_size
+
+        self.buffers: dict[str, FrameBuffer] = {}
+        self.size = 0  # bytes, in every buffer
+
+        self.relayed = 0
+        self.dropped = 0  # bundles dropped before every spectator read them
+        self.resyncs = 0
+
+    def __len__(self) -> int:
+        return len(self.buffers)
+
+    @property
+    def spectators(self) -> int:
+        return sum(len(buffer.cursors) for buffer in self.buffers.values())
+
+    def add_spectator(self, host_token: str, token: str) -> None:
+        buffer = self.buffers.get(host_token)
+        if buffer is None:
+            buffer = self.buffers[host_token] = FrameBuffer()
+
+        buffer.add_reader(token)
+
+    def remove_spectator(self, host_token: str, token: str) -> None:
+        buffer = self.buffers.get(host_token)
+        if buffer is None:
+            return None
+
+        size = buffer.size
+        buffer.remove_reader(token)
+        self.size -= size - buffer.size
+
+        if not buffer.cursors:
+            self.remove_host(host_token)
+
+    def remove_host(self, host_token: str) -> None:
+        buffer = self.buffers.pop(host_token, None)
+        if buffer is not None:
+            self.size -= buffer.size
+
+    def relay(self, host_token: str, bundle: bytes) -> None:
+        """Keeps `bundle` (a `packets.spectate_frames`) until every spectator read it."""
+        buffer = self.buffers.get(host_token)
+        if buffer is None:
+            return None
+
+        size = buffer.size
+        buffer.append(bundle)
+        self.relayed += 1
+
+        # the newest bundle is always kept
+        while len(buffer.bundles) > 1 and (
+            buffer.size > self.max_host_size
+            or self.size + buffer.size - size > self.max_size
+        ):
+            buffer.pop()
+            self.dropped += 1
+
+        self.size += buffer.size - size
+
+    def read(self, host_token: str, token: str) -> tuple[bytes, bool]:
+        """The bundles to send to spectator `token`, and whether it was
+        resynced for the first time, after losing bundles."""
+        buffer = self.buffers.get(host_token)
+        if buffer is None or token not in buffer.cursors:
+            return b"", False
+
+        size = buffer.size
+        data, lagged = buffer.read(token)
+        self.size -= size - buffer.size
+
+        if not lagged:
+            return data, False
+
+        self.resyncs += 1
+
+        if token in buffer.lagging:
+            return data, False
+
+        buffer.lagging.add(token)
+        return data, True
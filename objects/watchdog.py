@@ -0,0 +1,189 @@
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+import metrics
+from objects.rate_limits import RateLimiter
+
+# seconds, an event loop that's doing fine lags well under a millisecond
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes up from an `interval` second sleep.
+
+    That's how long every other callback had to wait as well, behind a slow
+    handler or a synchronous database call. Lags past `threshold` are logged,
+    at most a few times a minute."""
+
+    def __init__(self, interval: float, threshold: float) -> None:
+        self.interval = interval
+        self.threshold = threshold
+
+        self.lag = metrics.Histogram(LAG_BUCKETS)
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.stalls = 0  # lags past `threshold`
+
+        self.logs = RateLimiter(rate=0.1, burst=3, max_keys=1)
+        self.task: Optional[asyncio.Task] = None
+
+    def observe(self, lag: float) -> None:
+        self.lag.observe(lag)
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+
+        if lag <= self.threshold:
+            return None
+
+        self.stalls += 1
+
+        if self.logs.allow("lag"):
+            print(f"Event loop lagged {lag * 1000:.0f}ms")
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.observe(max(loop.time() - expected, 0.0))
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self.task is None:
+            return None
+
+        self.task.cancel()
+
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+
+        self.task = None
+
+
+class Operation:
+    __slots__ = ("kind", "name", "session", "started", "flagged")
+
+    def __init__(self, kind: str, name: str, session: str) -> None:
+        self.kind = kind  # "packet" or "login"
+        self.name = name
+        self.session = session
+        self.started = time.perf_counter()
+        self.flagged = False
+
+
+class Watchdog:
+    """Flags packet handlers and logins that run for longer than `threshold` seconds.
+
+    A daemon thread checks what's running every `interval` seconds, so a
+    stuck event loop is still caught while it's stuck, and logs the event
+    loop thread's stack at that moment. Logs are rate limited per operation
+    name, `slow` counts every flagged operation either way."""
+
+    def __init__(
+        self, threshold: float, interval: float, stack_limit: int = 12
+    ) -> None:
+        self.threshold = threshold
+        self.interval = interval
+        self.stack_limit = stack_limit
+
+        # only changed from the event loop, the thread reads a copy
+        self.running: dict[int, Operation] = {}
+        self.next_id = 0
+
+        self.slow: dict[str, int] = {}  # by kind
+        self.flag_lock = threading.Lock()
+        self.logs = RateLimiter(rate=0.1, burst=3, max_keys=256)
+
+        self.loop_thread_id: Optional[int] = None
+        self.thread: Optional[threading.Thread] = None
+        self.stopped = threading.Event()
+
+    def begin(self, kind: str, name: str, session: str) -> int:
+        operation_id = self.next_id
+        self.next_id += 1
+
+        self.running[operation_id] = Operation(kind, name, session)
+        return operation_id
+
+    def end(self, operation_id: int) -> None:
+        operation = self.running.pop(operation_id, None)
+
+        # slow, but done before the thread got to it
+        if operation is not None and not operation.flagged:
+            if time.perf_counter() - operation.started > self.threshold:
+                self.flag(operation, stack=None)
+
+    def flag(self, operation: Operation, stack: Optional[str]) -> None:
+        with self.flag_lock:
+            if operation.flagged:
+                return None
+
+            operation.flagged = True
+            self.slow[operation.kind] = self.slow.get(operation.kind, 0) + 1
+
+            if not self.logs.allow(operation.name):
+                return None
+
+        elapsed = time.perf_counter() - operation.started
+        message = (
+            f"Slow {operation.kind} {operation.name} for {operation.session}: "
+            f"{elapsed * 1000:.0f}ms"
+        )
+
+        if stack is not None:
+            message += f", event loop stack:\n{stack}"
+
+        print(message)
+
+    def loop_stack(self) -> Optional[str]:
+        if self.loop_thread_id is None:
+            return None
+
+        frame = sys._current_frames().get(self.loop_thread_id)
+        if frame is None:
+            return None
+
+        return "".join(traceback.format_stack(frame, limit=self.stack_limit))
+
+    def check(self) -> None:
+        now = time.perf_counter()
+        stack = None
+
+        for operation in list(self.running.values()):
+            if operation.flagged or now - operation.started <= self.threshold:
+                continue
+
+            # sampled once, it's the same thread for every operation
+            if stack is None:
+                stack = self.loop_stack()
+
+            self.flag(operation, stack)
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            self.check()
+
+    def start(self) -> None:
+        """Has to be called from the event loop's thread."""
+        self.loop_thread_id = threading.get_ident()
+        self.stopped.clear()
+
+        self.thread = threading.Thread(target=self.run, name="watchdog", daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        if self.thread is None:
+            return None
+
+        self.stopped.set()
+        self.thread.join()
+        self.thread = None
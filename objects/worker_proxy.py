@@ -0,0 +1,331 @@
+import asyncio
+import itertools
+import time
+from typing import Any, Awaitable, Callable, Collection, Optional
+
+import h11
+
+# only about the connection they came on, never forwarded
+HOP_BY_HOP_HEADERS = frozenset(
+    (
+        b"connection",
+        b"keep-alive",
+        b"proxy-connection",
+        b"te",
+        b"trailer",
+        b"transfer-encoding",
+        b"upgrade",
+    )
+)
+
+# seconds, uvicorn closes connections idle for 5
+MAX_IDLE_TIME = 4.0
+
+# scraped from every worker, see `merge_metrics`
+METRICS_PATH = b"/api/v1/metrics"
+PROMETHEUS_CONTENT_TYPE = b"text/plain; version=0.0.4; charset=utf-8"
+
+Receive = Callable[[], Awaitable[dict[str, Any]]]
+Send = Callable[[dict[str, Any]], Awaitable[None]]
+
+
+def label_sample(line: str, worker_id: int) -> str:
+    name_end = line.index(" ")
+    labels_start = line.find("{", 0, name_end)
+
+    if labels_start == -1:
+        return f'{line[:name_end]}{{worker="{worker_id}"}}{line[name_end:]}'
+
+    labels_start += 1
+    return f'{line[:labels_start]}worker="{worker_id}",{line[labels_start:]}'
+
+
+def merge_metrics(pages: dict[int, bytes]) -> bytes:
+    """Joins the workers' metrics pages into one, by worker id.
+
+    Every sample gets a `worker` label, each family's HELP and TYPE is
+    only written once."""
+    headers: dict[str, list[str]] = {}  # family name -> HELP and TYPE lines
+    samples: dict[str, list[str]] = {}
+
+    for worker_id, page in pages.items():
+        family = ""
+
+        for line in page.decode().splitlines():
+            if line.startswith("# "):
+                family = line.split(" ", 3)[2]
+
+                family_headers = headers.setdefault(family, [])
+                if line not in family_headers:
+                    family_headers.append(line)
+            elif line:
+                samples.setdefault(family, []).append(label_sample(line, worker_id))
+
+    lines: list[str] = []
+    for family, family_headers in headers.items():
+        lines += family_headers
+        lines += samples.get(family, ())
+
+    return ("\n".join(lines) + "\n").encode()
+
+
+class WorkerConnection:
+    """A keep-alive HTTP/1.1 connection to one worker."""
+
+    __slots__ = ("reader", "writer", "connection", "last_used")
+
+    def __init__(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        self.reader = reader
+        self.writer = writer
+        self.connection = h11.Connection(h11.CLIENT)
+        self.last_used = time.monotonic()
+
+    async def request(
+        self, request: h11.Request, body: bytes
+    ) -> tuple[h11.Response, bytes]:
+        connection = self.connection
+
+        data = connection.send(request)
+        if body:
+            data += connection.send(h11.Data(data=body))
+        data += connection.send(h11.EndOfMessage())
+        self.writer.write(data)
+
+        response: Optional[h11.Response] = None
+        chunks: list[bytes] = []
+
+        while True:
+            event = connection.next_event()
+
+            if event is h11.NEED_DATA:
+                connection.receive_data(await self.reader.read(65536))
+            elif isinstance(event, h11.Response):
+                response = event
+            elif isinstance(event, h11.Data):
+                chunks.append(event.data)
+            elif isinstance(event, h11.EndOfMessage):
+                break
+            elif isinstance(event, h11.ConnectionClosed):
+                raise ConnectionError("the worker closed the connection")
+
+        assert response is not None
+        self.last_used = time.monotonic()
+        return response, b"".join(chunks)
+
+    def reuse(self) -> bool:
+        """Readies the connection for the next request, if it can take one."""
+        connection = self.connection
+
+        if (
+            connection.our_state is not h11.DONE
+            or connection.their_state is not h11.DONE
+        ):
+            return False
+
+        connection.start_next_cycle()
+        return True
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+class WorkerProxy:
+    """An ASGI app that forwards each request to the worker owning its session.
+
+    Polls carry the session's cho token, which starts with "<worker id>:",
+    logins don't have one yet and go to each worker in turn. Anything else
+    goes to worker 0, except the metrics, which are scraped from every
+    worker and merged, see `merge_metrics`. The client's
+    address is passed on in X-Real-IP, which the workers trust from
+    127.0.0.1, unless it came from one of `trusted_proxies` already."""
+
+    def __init__(
+        self, host: str, ports: list[int], trusted_proxies: Collection[str]
+    ) -> None:
+        self.host = host
+        self.ports = ports
+        self.trusted_proxies = trusted_proxies
+
+        self.idle: list[list[WorkerConnection]] = [[] for _ in ports]
+        self.logins = itertools.cycle(range(len(ports)))
+
+        self.forwarded = 0
+        self.failed = 0
+
+    def worker_for(self, method: bytes, token: Optional[bytes]) -> int:
+        if token:
+            worker_id, separator, _ = token.partition(b":")
+
+            if separator and worker_id.isdigit() and int(worker_id) < len(self.ports):
+                return int(worker_id)
+
+        # a login, any worker can take it
+        if method == b"POST":
+            return next(self.logins)
+
+        return 0
+
+    async def connect(self, worker_id: int) -> WorkerConnection:
+        idle = self.idle[worker_id]
+        now = time.monotonic()
+
+        while idle:
+            connection = idle.pop()
+
+            if now - connection.last_used < MAX_IDLE_TIME:
+                return connection
+
+            connection.close()
+
+        reader, writer = await asyncio.open_connection(self.host, self.ports[worker_id])
+        return WorkerConnection(reader, writer)
+
+    async def forward(
+        self, worker_id: int, request: h11.Request, body: bytes
+    ) -> tuple[h11.Response, bytes]:
+        connection = await self.connect(worker_id)
+
+        try:
+            response, response_body = await connection.request(request, body)
+        except BaseException:
+            connection.close()
+            raise
+
+        if connection.reuse():
+            self.idle[worker_id].append(connection)
+        else:
+            connection.close()
+
+        return response, response_body
+
+    def close(self) -> None:
+        for idle in self.idle:
+            for connection in idle:
+                connection.close()
+
+            idle.clear()
+
+    def request_headers(self, scope: dict[str, Any], body: bytes) -> list:
+        headers = [
+            (name, value)
+            for name, value in scope["headers"]
+            if name not in HOP_BY_HOP_HEADERS and name != b"content-length"
+        ]
+        headers.append((b"content-length", str(len(body)).encode()))
+
+        client = scope.get("client")
+        if client is not None and client[0] not in self.trusted_proxies:
+            headers = [(n, v) for n, v in headers if n != b"x-real-ip"]
+            headers.append((b"x-real-ip", client[0].encode()))
+
+        if not any(name == b"host" for name, _ in headers):
+            headers.append((b"host", self.host.encode()))
+
+        return headers
+
+    async def __call__(
+        self, scope: dict[str, Any], receive: Receive, send: Send
+    ) -> None:
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+
+        if scope["type"] != "http":
+            return None
+
+        body = bytearray()
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+
+            if not message.get("more_body"):
+                break
+
+        target = scope["raw_path"]
+        if scope["query_string"]:
+            target += b"?" + scope["query_string"]
+
+        request = h11.Request(
+            method=scope["method"],
+            target=target,
+            headers=self.request_headers(scope, bytes(body)),
+        )
+
+        if scope["raw_path"] == METRICS_PATH:
+            return await self.scrape(request, send)
+
+        token = next(
+            (value for name, value in scope["headers"] if name == b"osu-token"), None
+        )
+        worker_id = self.worker_for(request.method, token)
+
+        try:
+            response, response_body = await self.forward(
+                worker_id, request, bytes(body)
+            )
+        except (OSError, h11.ProtocolError) as exc:
+            self.failed += 1
+            print(f"Couldn't forward a request to worker {worker_id}: {exc!r}")
+
+            await send({"type": "http.response.start", "status": 502, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+            return None
+
+        self.forwarded += 1
+
+        await send(
+            {
+                "type": "http.response.start",
+                "status": response.status_code,
+                "headers": [
+                    (name, value)
+                    for name, value in response.headers
+                    if name not in HOP_BY_HOP_HEADERS
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": response_body})
+
+    async def scrape(self, request: h11.Request, send: Send) -> None:
+        results = await asyncio.gather(
+            *[
+                self.forward(worker_id, request, b"")
+                for worker_id in range(len(self.ports))
+            ],
+            return_exceptions=True,
+        )
+
+        pages: dict[int, bytes] = {}
+
+        for worker_id, result in enumerate(results):
+            if isinstance(result, BaseException):
+                self.failed += 1
+                print(f"Couldn't scrape worker {worker_id}'s metrics: {result!r}")
+                continue
+
+            response, response_body = result
+            if response.status_code == 200:
+                pages[worker_id] = response_body
+
+        self.forwarded += 1
+
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200 if pages else 502,
+                "headers": [(b"content-type", PROMETHEUS_CONTENT_TYPE)],
+            }
+        )
+        await send({"type": "http.response.body", "body": merge_metrics(pages)})
+
+    async def lifespan(self, receive: Receive, send: Send) -> None:
+        while True:
+            message = await receive()
+
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.close()
+                await send({"type": "lifespan.shutdown.complete"})
+                return None
@@ -1,13 +1,13 @@
 import enum
 import struct
+import time
 from dataclasses import dataclass, field
-from typing import TYPE_CHECKING, Any, Optional, Sequence, Union
+from typing import TYPE_CHECKING, Any, Collection, Optional, Union
 
+import metrics
 import objects.matches
 import utils
 from enums.actions import ActionType
-from enums.game_mode import GameMode
-from enums.mods import Mods
 from enums.multiplayer import SlotStatus
 from enums.presence import PresenceFilter
 
@@ -141,11 +141,17 @@ class Action:
     action_type: ActionType
     info_text: str
     map_md5: str
-    mods: Mods
-    mode: GameMode
+    mods: int  # see utils.normalize_mods_and_mode
+    mode: int
     map_id: int
 
 
+@dataclass
+class JoinMatch:
+    match_id: int
+    pass_word: str
+
+
 @dataclass
 class Message:
     sender: str  # TODO: should it always be an empty string?
@@ -187,8 +193,19 @@ class Match:
 NO_PACKET_DATA = [
     ClientPackets.REQUEST_STATUS_UPDATE,
     ClientPackets.PING,
-    ClientPackets.PART_MATCH
+    ClientPackets.PART_MATCH,
+    ClientPackets.MATCH_START,
+    ClientPackets.MATCH_LOAD_COMPLETE,
+    ClientPackets.MATCH_SKIP_REQUEST,
+    ClientPackets.MATCH_COMPLETE,
+    ClientPackets.MATCH_FAILED,
+    ClientPackets.STOP_SPECTATING,
+    ClientPackets.CANT_SPECTATE,
 ]  # no packet data is provided when this packet is sent to the server
+RAW_PACKET_DATA = {
+    ClientPackets.MATCH_SCORE_UPDATE,
+    ClientPackets.SPECTATE_FRAMES,
+}  # relayed without being decoded, the handler gets the packet data as bytes
 USER_IDS = list[int]
 CHANNEL_NAME = str
 
@@ -201,6 +218,8 @@ VALID_PACKET_DATA = Union[
     PresenceFilter,
     CHANNEL_NAME,
     Match,
+    JoinMatch,
+    bytes,
 ]
 
 
@@ -232,6 +251,9 @@ class PacketReader:
         if self.packet_id in NO_PACKET_DATA:
             return None
 
+        if self.packet_id in RAW_PACKET_DATA:
+            return self.read_packet_raw()
+
         parsing_functions = {
             ClientPackets.CHANGE_ACTION: self.read_action,
             ClientPackets.USER_STATS_REQUEST: self.read_user_stats_request,
@@ -244,8 +266,11 @@ class PacketReader:
             ClientPackets.JOIN_LOBBY: self.read_join_lobby,
             ClientPackets.PART_LOBBY: self.read_part_lobby,
             ClientPackets.CREATE_MATCH: self.read_match,
+            ClientPackets.JOIN_MATCH: self.read_join_match,
             ClientPackets.START_SPECTATING: self.read_start_spectating,
             ClientPackets.MATCH_CHANGE_SETTINGS: self.read_match,
+            ClientPackets.FRIEND_ADD: self.read_friend_id,
+            ClientPackets.FRIEND_REMOVE: self.read_friend_id,
         }
 
         if self.packet_id not in parsing_functions:
@@ -253,9 +278,22 @@ class PacketReader:
 
         return parsing_functions[self.packet_id]()
 
+    def read_packet_raw(self) -> bytes:
+        """The packet's data, as sent, for packets that are relayed without decoding."""
+        return self.read_raw(self.length)
+
+    def read_join_match(self) -> JoinMatch:
+        return JoinMatch(
+            match_id=self.read_int(),
+            pass_word=self.read_string(),
+        )
+
     def read_start_spectating(self) -> int:
         return self.read_int()
 
+    def read_friend_id(self) -> int:
+        return self.read_int()
+
     def read_match(self) -> Match:
         match = Match(
             id=self.read_short(),
@@ -326,7 +364,7 @@ class PacketReader:
 
         map_md5 = self.read_string()
 
-        mods, game_mode = utils.ensure_mods_and_gamemode(
+        mods, game_mode = utils.normalize_mods_and_mode(
             mods=self.read_unsigned_int(),
             game_mode=self.read_unsigned_byte(),
         )
@@ -399,7 +437,7 @@ class PacketReader:
         return ""
 
     def read_raw(self, length: int) -> bytes:
-        val = self.buffer_data[:length]
+        val = self.raw_data[self.offset : self.offset + length]
         self.offset += length
         return val
 
@@ -431,6 +469,7 @@ class Packet:
 
 
 def read_packets(client_packets: bytes) -> list[Packet]:
+    started = time.perf_counter()
     packets = []
 
     reader = PacketReader(client_packets)
@@ -457,6 +496,10 @@ def read_packets(client_packets: bytes) -> list[Packet]:
             )
         )
 
+    metrics.DECODE_SECONDS.observe(time.perf_counter() - started)
+    for packet in packets:
+        metrics.DECODED.count(packet.id)
+
     return packets
 
 
@@ -514,7 +557,7 @@ def write_long_long(l: int) -> bytes:
     return struct.pack("<q", l)
 
 
-def write_list_32(l: Sequence[int]) -> bytes:
+def write_list_32(l: Collection[int]) -> bytes:
     ret = bytearray(write_short(len(l)))
 
     for item in l:
@@ -530,6 +573,7 @@ def write_packet(packet_id: int, *packet_data: bytes) -> bytes:
         packet += data
 
     packet[3:3] = struct.pack("<I", len(packet) - 3)
+    metrics.ENCODED.count(packet_id, len(packet))
     return bytes(packet)
 
 
@@ -657,7 +701,7 @@ def channel_kick(
     )
 
 
-def friends_list(friends: Optional[Sequence[int]] = None) -> bytes:
+def friends_list(friends: Optional[Collection[int]] = None) -> bytes:
     if friends is None:
         friends = []
 
@@ -711,7 +755,7 @@ def pack_osu_session_stats(session: "Session") -> bytes:
         info_text=session.osu_client.status.info_text,  # TODO
         map_md5=session.osu_client.status.map_md5,
         mods=session.osu_client.status.mods,
-        mode=session.osu_client.status.mode.as_osu_client,
+        mode=utils.client_mode(session.osu_client.status.mode),
         map_id=session.osu_client.status.map_id,
         ranked_score=0,  # TODO:
         acc=100.0,  # TODO
@@ -727,13 +771,9 @@ def pack_osu_session_presence(session: "Session") -> bytes:
         user_id=session.account.user_id,
         user_name=session.account.user_name,
         utc_offset=session.utc_offset,
-        country=session.osu_client.country_code_to_client_code(
-            session.account.country_code
-        ),
-        bancho_privleges=session.osu_client.server_to_client_privileges(
-            session.privileges
-        ),
-        mode=session.osu_client.status.mode.as_osu_client,
+        country=session.country,
+        bancho_privleges=session.client_privileges,
+        mode=utils.client_mode(session.osu_client.status.mode),
         location=(0.0, 0.0),  # TODO: longitude, latitude
         rank=1,  # TODO
     )
@@ -747,9 +787,70 @@ def match_join_fail() -> bytes:
     return write_packet(ServerPackets.MATCH_JOIN_FAIL)
 
 
-def match_join_sucess(
+PACKET_HEADER = struct.Struct("<HxI")
+
+# offset of the slot id in a score frame, after its i32 time
+SCORE_FRAME_SLOT_ID = 4
+
+
+def match_score_update(score_frame: bytes, slot_id: int) -> bytes:
+    """A player's MATCH_SCORE_UPDATE, relayed as is apart from the slot id."""
+    packet = bytearray(
+        PACKET_HEADER.pack(ServerPackets.MATCH_SCORE_UPDATE, len(score_frame))
+    )
+    packet += score_frame
+    packet[PACKET_HEADER.size + SCORE_FRAME_SLOT_ID] = slot_id
+    metrics.ENCODED.count(ServerPackets.MATCH_SCORE_UPDATE, len(packet))
+    return bytes(packet)
+
+
+def match_start(match: "objects.matches.Match") -> bytes:
+    return match_packet(ServerPackets.MATCH_START, match, send_pass_word=True)
+
+
+def match_all_players_loaded() -> bytes:
+    return write_packet(ServerPackets.MATCH_ALL_PLAYERS_LOADED)
+
+
+def match_player_skipped(user_id: int) -> bytes:
+    return write_packet(
+        ServerPackets.MATCH_PLAYER_SKIPPED,
+        write_int(user_id),
+    )
+
+
+def match_skip() -> bytes:
+    return write_packet(ServerPackets.MATCH_SKIP)
+
+
+def match_player_failed(slot_id: int) -> bytes:
+    return write_packet(
+        ServerPackets.MATCH_PLAYER_FAILED,
+        write_int(slot_id),
+    )
+
+
+def match_complete() -> bytes:
+    return write_packet(ServerPackets.MATCH_COMPLETE)
+
+
+def match_transfer_host() -> bytes:
+    return write_packet(ServerPackets.MATCH_TRANSFER_HOST)
+
+
+def dispose_match(match_id: int) -> bytes:
+    return write_packet(
+        ServerPackets.DISPOSE_MATCH,
+        write_int(match_id),
+    )
+
+
+SLOT_MODS = struct.Struct("<16I")
+
+
+def write_match(
     match: "objects.matches.Match",
-    send_pass_word: bool = True,
+    send_pass_word: bool,
 ) -> bytes:
     pass_word = b""
 
@@ -764,31 +865,90 @@ def match_join_sucess(
 
     free_mod = write_byte(match.free_mod)
     if match.free_mod:
-        for slot in match.slots:
-            free_mod += write_unsigned_int(slot.mods)
-
-    return write_packet(
-        ServerPackets.MATCH_JOIN_SUCCESS,
-        write_unsigned_short(match.id),
-        write_byte(match.in_progress),
-        write_byte(0),
-        write_unsigned_int(match.mods),
-        write_string(match.name),
-        pass_word,
-        write_string(match.name),
-        write_int(match.current_map.id),
-        write_string(match.current_map.md5),
-        *[write_byte(slot.status) for slot in match.slots],
-        *[write_byte(slot.team) for slot in match.slots],
-        *[
-            write_unsigned_int(slot.user_id)
-            for slot in match.slots
-            if slot.status & SlotStatus.HAS_PLAYER and slot.user_id
-        ],
-        write_unsigned_int(match.host_id),
-        write_byte(match.game_mode),
-        write_byte(match.win_condition),
-        write_byte(match.team_type),
-        free_mod,
-        write_byte(match.seed),
+        free_mod += SLOT_MODS.pack(*match.slot_mods)
+
+    user_ids = [user_id for user_id in match.slot_user_ids if user_id]
+
+    return b"".join(
+        (
+            write_unsigned_short(match.id),
+            write_byte(match.in_progress),
+            write_byte(0),
+            write_unsigned_int(match.mods),
+            write_string(match.name),
+            pass_word,
+            write_string(match.current_map.name),
+            write_int(match.current_map.id),
+            write_string(match.current_map.md5),
+            match.slot_statuses,  # 16 bytes
+            match.slot_teams,  # 16 bytes
+            struct.pack(f"<{len(user_ids)}I", *user_ids),
+            write_unsigned_int(match.host_id),
+            write_byte(utils.client_mode(match.game_mode)),
+            write_byte(match.win_condition),
+            write_byte(match.team_type),
+            free_mod,
+            write_int(match.seed),
+        )
     )
+
+
+def match_packet(
+    packet_id: int,
+    match: "objects.matches.Match",
+    send_pass_word: bool,
+) -> bytes:
+    """Cached on the match until `Match.invalidate` is called."""
+    key = (packet_id, send_pass_word)
+
+    packet = match.packets.get(key)
+    if packet is None:
+        packet = write_packet(packet_id, write_match(match, send_pass_word))
+        match.packets[key] = packet
+
+    return packet
+
+
+def match_join_sucess(
+    match: "objects.matches.Match",
+    send_pass_word: bool = True,
+) -> bytes:
+    return match_packet(ServerPackets.MATCH_JOIN_SUCCESS, match, send_pass_word)
+
+
+def new_match(match: "objects.matches.Match") -> bytes:
+    return match_packet(ServerPackets.NEW_MATCH, match, send_pass_word=False)
+
+
+def update_match(
+    match: "objects.matches.Match",
+    send_pass_word: bool,
+) -> bytes:
+    return match_packet(ServerPackets.UPDATE_MATCH, match, send_pass_word)
+
+
+def spectate_frames(frames: bytes) -> bytes:
+    """A host's SPECTATE_FRAMES, relayed as is under the server's packet id."""
+    packet = PACKET_HEADER.pack(ServerPackets.SPECTATE_FRAMES, len(frames)) + frames
+    metrics.ENCODED.count(ServerPackets.SPECTATE_FRAMES, len(packet))
+    return packet
+
+
+def spectator_joined(user_id: int) -> bytes:
+    return write_packet(ServerPackets.SPECTATOR_JOINED, write_int(user_id))
+
+
+def spectator_left(user_id: int) -> bytes:
+    return write_packet(ServerPackets.SPECTATOR_LEFT, write_int(user_id))
+
+
+def fellow_spectator_joined(user_id: int) -> bytes:
+    return write_packet(ServerPackets.FELLOW_SPECTATOR_JOINED, write_int(user_id))
+
+
+def fellow_spectator_left(user_id: int) -> bytes:
+    return write_packet(ServerPackets.FELLOW_SPECTATOR_LEFT, write_int(user_id))
+
+
+def spectator_cant_spectate(user_id: int) -> bytes:
+    return write_packet(ServerPackets.SPECTATOR_CANT_SPECTATE, write_int(user_id))
@@ -1,3 +1,270 @@
 from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+import common
+import metrics
+from packets import ClientPackets, ServerPackets
 
 api_router = APIRouter(tags=["Bancho api for external usage"])
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def export_packets(page: metrics.Exposition) -> None:
+    handled = metrics.HANDLED
+    encoded = metrics.ENCODED
+
+    page.labelled(
+        "bancho_packets_handled_total",
+        "counter",
+        "Client packets handled, by packet",
+        (
+            ({"packet": p.name}, handled.counts[p])
+            for p in ClientPackets
+            if handled.counts[p]
+        ),
+    )
+    page.labelled(
+        "bancho_packet_errors_total",
+        "counter",
+        "Client packet handlers that raised, by packet",
+        (
+            ({"packet": p.name}, handled.errors[p])
+            for p in ClientPackets
+            if handled.errors[p]
+        ),
+    )
+
+    page.family(
+        "bancho_packet_handler_seconds",
+        "histogram",
+        "Time spent in client packet handlers, by packet",
+    )
+    for packet_id in ClientPackets:
+        histogram = handled.latencies[packet_id]
+        if histogram is not None:
+            page.histogram(
+                "bancho_packet_handler_seconds", histogram, {"packet": packet_id.name}
+            )
+
+    page.labelled(
+        "bancho_packets_decoded_total",
+        "counter",
+        "Client packets read, by packet",
+        (
+            ({"packet": p.name}, metrics.DECODED.counts[p])
+            for p in ClientPackets
+            if metrics.DECODED.counts[p]
+        ),
+    )
+
+    page.family(
+        "bancho_packet_decode_seconds",
+        "histogram",
+        "Time spent reading the packets of a request",
+    )
+    page.histogram("bancho_packet_decode_seconds", metrics.DECODE_SECONDS)
+
+    page.labelled(
+        "bancho_packets_encoded_total",
+        "counter",
+        "Server packets written, by packet",
+        (
+            ({"packet": p.name}, encoded.counts[p])
+            for p in ServerPackets
+            if encoded.counts[p]
+        ),
+    )
+    page.labelled(
+        "bancho_packets_encoded_bytes_total",
+        "counter",
+        "Bytes of server packets written, by packet",
+        (
+            ({"packet": p.name}, encoded.sizes[p])
+            for p in ServerPackets
+            if encoded.counts[p]
+        ),
+    )
+
+
+def export_objects(page: metrics.Exposition) -> None:
+    page.gauge(
+        "bancho_sessions", "Sessions online in this worker", len(common.sessions)
+    )
+    page.gauge(
+        "bancho_channels", "Channels, including match channels", len(common.channels)
+    )
+    page.gauge("bancho_matches", "Multiplayer matches", len(common.matches))
+    page.gauge(
+        "bancho_lobby_sessions", "Sessions in the multiplayer lobby", len(common.lobby)
+    )
+
+    bus = common.bus
+    page.counter("bancho_bus_published_total", "Packets published", bus.published)
+    page.counter(
+        "bancho_bus_received_total",
+        "Messages received from other workers",
+        bus.received,
+    )
+    page.gauge(
+        "bancho_bus_directory_sessions",
+        "Sessions online in every worker",
+        len(bus.directory),
+    )
+
+    relay = common.frame_relay
+    page.gauge(
+        "bancho_spectate_frames_bytes",
+        "Bytes of spectate frames kept for spectators",
+        relay.size,
+    )
+    page.gauge("bancho_spectate_hosts", "Hosts with spectators", len(relay))
+    page.gauge("bancho_spectators", "Sessions spectating", relay.spectators)
+    page.counter(
+        "bancho_spectate_frames_relayed_total",
+        "Spectate frame bundles relayed",
+        relay.relayed,
+    )
+    page.counter(
+        "bancho_spectate_frames_dropped_total",
+        "Spectate frame bundles dropped before every spectator read them",
+        relay.dropped,
+    )
+    page.counter(
+        "bancho_spectator_resyncs_total",
+        "Spectators resynced after falling behind",
+        relay.resyncs,
+    )
+
+    admission = common.locks.LOGIN_ADMISSION
+    page.gauge("bancho_login_admission_active", "Logins running", admission.active)
+    page.gauge(
+        "bancho_login_admission_queued", "Logins waiting to run", admission.queued
+    )
+    page.counter(
+        "bancho_login_admission_admitted_total", "Logins admitted", admission.admitted
+    )
+    page.counter(
+        "bancho_login_admission_rejected_total",
+        "Logins rejected, the queue was full",
+        admission.rejected,
+    )
+    page.counter(
+        "bancho_login_admission_timed_out_total",
+        "Logins that waited too long to run",
+        admission.timed_out,
+    )
+    page.counter(
+        "bancho_login_admission_wait_seconds_total",
+        "Time logins spent waiting to run",
+        admission.wait_time_total,
+    )
+
+    caches = (("accounts", common.accounts), ("credentials", common.credentials))
+    page.labelled(
+        "bancho_cache_entries",
+        "gauge",
+        "Entries in a cache",
+        (({"cache": name}, len(cache)) for name, cache in caches),
+    )
+    page.labelled(
+        "bancho_cache_hits_total",
+        "counter",
+        "Cache hits",
+        (({"cache": name}, cache.hits) for name, cache in caches),
+    )
+    page.labelled(
+        "bancho_cache_misses_total",
+        "counter",
+        "Cache misses",
+        (({"cache": name}, cache.misses) for name, cache in caches),
+    )
+
+    limits = (
+        ("login_ip", common.limits.LOGIN_IP),
+        ("login_user_name", common.limits.LOGIN_USER_NAME),
+    )
+    page.labelled(
+        "bancho_rate_limit_allowed_total",
+        "counter",
+        "Requests allowed by a rate limit",
+        (({"limit": name}, limiter.allowed) for name, limiter in limits),
+    )
+    page.labelled(
+        "bancho_rate_limit_limited_total",
+        "counter",
+        "Requests refused by a rate limit",
+        (({"limit": name}, limiter.limited) for name, limiter in limits),
+    )
+
+    queues = common.queues.ALL_QUEUES
+    page.labelled(
+        "bancho_queue_pending",
+        "gauge",
+        "Writes waiting to be flushed",
+        (({"queue": queue.name}, len(queue)) for queue in queues),
+    )
+    page.labelled(
+        "bancho_queue_flushed_total",
+        "counter",
+        "Writes flushed",
+        (({"queue": queue.name}, queue.flushed) for queue in queues),
+    )
+    page.labelled(
+        "bancho_queue_dropped_total",
+        "counter",
+        "Writes dropped, the queue was full",
+        (({"queue": queue.name}, queue.dropped) for queue in queues),
+    )
+    page.labelled(
+        "bancho_queue_failures_total",
+        "counter",
+        "Flushes that failed",
+        (({"queue": queue.name}, queue.failures) for queue in queues),
+    )
+
+
+def export_monitor(page: metrics.Exposition) -> None:
+    lag = common.monitor.LOOP_LAG
+    page.family(
+        "bancho_event_loop_lag_seconds",
+        "histogram",
+        "How late the event loop ran a timer",
+    )
+    page.histogram("bancho_event_loop_lag_seconds", lag.lag)
+    page.gauge(
+        "bancho_event_loop_lag_max_seconds", "Longest event loop lag", lag.max_lag
+    )
+    page.counter(
+        "bancho_event_loop_stalls_total",
+        "Event loop lags past the logging threshold",
+        lag.stalls,
+    )
+
+    watchdog = common.monitor.WATCHDOG
+    page.gauge(
+        "bancho_running_operations",
+        "Packet handlers and logins running",
+        len(watchdog.running),
+    )
+    page.labelled(
+        "bancho_slow_operations_total",
+        "counter",
+        "Packet handlers and logins that ran past the slow threshold",
+        (({"kind": kind}, count) for kind, count in list(watchdog.slow.items())),
+    )
+    page.counter(
+        "bancho_slow_operation_logs_suppressed_total",
+        "Slow operations that weren't logged, by the log rate limit",
+        watchdog.logs.limited,
+    )
+
+
+@api_router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics() -> PlainTextResponse:
+    page = metrics.Exposition()
+    export_packets(page)
+    export_objects(page)
+    export_monitor(page)
+
+    return PlainTextResponse(page.text(), media_type=PROMETHEUS_CONTENT_TYPE)
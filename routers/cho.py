@@ -1,24 +1,46 @@
+import asyncio
 import json
 import time
 import uuid
-from datetime import datetime
 from typing import Any, AsyncIterable, Callable, Literal, Optional, TypedDict
 
-import pytz
 from fastapi import APIRouter, Depends, Header, Request, Response
 from fastapi.responses import HTMLResponse
 from passlib.hash import argon2
 from sqlmodel import Session as DatabaseSession
-from sqlmodel import select
+from sqlmodel import func, select
 
 import common
 import config
 import constants
+import metrics
 import packets
+import utils
 from database import models as database_models
+from database.writers import FriendshipChange
+from enums.multiplayer import SlotStatus
 from enums.presence import PresenceFilter
 from enums.privileges import ServerPrivileges
-from objects import ClientDetails, LoginData, Match, OsuClient, Session
+from objects import (
+    AccountRecord,
+    ClientDetails,
+    LoginData,
+    Match,
+    OsuClient,
+    Session,
+)
+from objects.admission import AdmissionRejected
+from objects.channels import Channel
+from objects.event_bus import (
+    LOBBY_TOPIC,
+    BusUnavailable,
+    channel_topic,
+    logout_topic,
+    match_topic,
+    presence_topic,
+    user_topic,
+)
+from objects.matches import BARRIERS, COMPLETED, LOADED, SKIPPED
 from packets import ClientPackets
 
 bancho_router = APIRouter(
@@ -55,31 +77,57 @@ def parse_login_data(login_data: bytes) -> LoginData:
     )
 
 
-async def generate_user_id(database_session: DatabaseSession) -> int:
-    query = select(database_models.Account)
-    accounts = database_session.exec(query).all()
+async def get_account_from_user_name(
+    user_name: str,
+    database_session: DatabaseSession,
+) -> Optional[AccountRecord]:
+    account = common.accounts.get_from_user_name(user_name)
+    if account is not None:
+        return account
 
-    if not accounts:
-        return 4  # Use 3 for bot account
-    else:
-        return len(accounts) + 4
+    # matches the `lower(user_name)` index, see `database.migrations`
+    query = select(database_models.Account).where(
+        func.lower(database_models.Account.user_name)
+        == utils.normalize_user_name(user_name)
+    )
+    account_model = database_session.exec(query).first()
+
+    if account_model is None:
+        return None
+
+    account = account_model.as_account_record(
+        friends=await get_friends(account_model.id, database_session),
+    )
+    common.accounts.add(account)
+
+    return account
+
+
+async def get_friends(user_id: int, database_session: DatabaseSession) -> set[int]:
+    session = common.sessions.get_from_user_id(user_id)
+    if session is not None:
+        # while online the session's set is up to date,
+        # the database may still be waiting on `common.queues.FRIENDSHIPS`
+        return session.account.friends
+
+    query = select(database_models.Friendship.friend_id).where(
+        database_models.Friendship.user_id == user_id
+    )
+    return set(database_session.exec(query).all())
 
 
 async def create_account(
     user_name: str,
     pass_md5: str,
     utc_offset: int,
-    client_details: ClientDetails,
     database_session: DatabaseSession,
-) -> database_models.Account:
-    user_id = await generate_user_id(database_session)
-
-    pass_argon2 = argon2.hash(pass_md5)
+) -> AccountRecord:
+    # argon2 releases the gil, keep it off the event loop
+    pass_argon2 = await asyncio.to_thread(argon2.hash, pass_md5)
 
     country_code = await get_country_code_from_utc_offset(utc_offset)
 
     account_model = database_models.Account(
-        id=user_id,
         user_name=user_name,
         pass_argon2=pass_argon2,
         friends=json.dumps([]),
@@ -91,43 +139,74 @@ async def create_account(
 
     database_session.commit()
 
-    client_details_model = database_models.ClientDetail(
-        user_id=user_id,
-        osu_version=client_details.osu_version,
-        osu_path_md5=client_details.osu_path_md5,
-        adapters_md5=client_details.adapters_md5,
-        uninstall_md5=client_details.uninstall_md5,
-        disk_signature_md5=client_details.disk_signature_md5,
-        adapters=json.dumps(client_details.adapters),
-        country_code=country_code,
-        login_date=time.time(),
-    )
+    account = account_model.as_account_record(friends=set())
+    common.accounts.add(account)
+
+    return account
+
+
+async def update_account(
+    user_id: int,
+    database_session: DatabaseSession,
+    privileges: Optional[ServerPrivileges] = None,
+    pass_md5: Optional[str] = None,
+) -> bool:
+    """Writes an account's privileges or password, whether the account exists.
+
+    Every change to an existing account goes through here, the cached
+    record and verified password are dropped so the next login reloads them."""
+    account_model = database_session.get(database_models.Account, user_id)
 
-    database_session.add(client_details_model)
+    if account_model is None:
+        return False
 
+    if privileges is not None:
+        account_model.privileges = privileges
+
+    if pass_md5 is not None:
+        account_model.pass_argon2 = await asyncio.to_thread(argon2.hash, pass_md5)
+
+    database_session.add(account_model)
     database_session.commit()
 
-    return account_model
+    common.accounts.remove(user_id)
+    common.credentials.remove(user_id)
 
+    session = common.sessions.get_from_user_id(user_id)
+    if session is not None and privileges is not None:
+        session.set_privileges(privileges)
+        session.osu_client.pending_packets += packets.bancho_privileges(
+            session.client_privileges
+        )
+        common.bus.publish(presence_topic(user_id), packets.pack_osu_session(session))
 
-async def get_country_code_from_utc_offset(utc_offset: int) -> str:
-    for time_zone in pytz.all_timezones:
-        tz = pytz.timezone(time_zone)
+    return True
 
-        offset = tz.utcoffset(datetime.now()).total_seconds() / 3600
 
-        if offset == utc_offset:
-            if tz.zone not in constants.time.time_zone_to_country_code:
-                continue
+def record_client_details(
+    account: AccountRecord, client_details: ClientDetails
+) -> None:
+    # written in batches by a background task, off the login path
+    common.queues.CLIENT_DETAILS.put(
+        database_models.ClientDetail(
+            user_id=account.id,
+            osu_version=client_details.osu_version,
+            osu_path_md5=client_details.osu_path_md5,
+            adapters_md5=client_details.adapters_md5,
+            uninstall_md5=client_details.uninstall_md5,
+            disk_signature_md5=client_details.disk_signature_md5,
+            adapters=json.dumps(client_details.adapters),
+            country_code=account.country_code,
+            login_date=time.time(),
+        )
+    )
 
-            country_code = constants.time.time_zone_to_country_code[tz.zone].lower()
+    # only needed in the database, don't keep them around for the whole session
+    client_details.adapters = ()
 
-            if country_code not in constants.time.country_codes_to_osu_code:
-                continue
-            else:
-                return country_code
 
-    return "XX"
+async def get_country_code_from_utc_offset(utc_offset: int) -> str:
+    return constants.time.get_country_code_from_utc_offset(utc_offset)
 
 
 class LoginResult(TypedDict):
@@ -135,6 +214,19 @@ class LoginResult(TypedDict):
     cho_token: str
 
 
+def login_failed(message: str) -> LoginResult:
+    return LoginResult(
+        packets=packets.user_id(-1) + packets.notification(message),
+        cho_token="no",
+    )
+
+
+def is_logged_in(account: AccountRecord) -> bool:
+    """Whether the account is online in any worker, as far as the directory
+    knows. Only a fast path, `EventBus.claim` is what decides."""
+    return common.bus.directory.get_from_user_id(account.id) is not None
+
+
 async def login_developer_mode(
     user_name: str,
     pass_md5: str,
@@ -142,21 +234,39 @@ async def login_developer_mode(
     client_details: ClientDetails,
     database_session: DatabaseSession,
 ) -> LoginResult:
-    query = select(database_models.Account).where(
-        database_models.Account.user_name == user_name
-    )
-    account = database_session.exec(query).first()
+    account = await get_account_from_user_name(user_name, database_session)
 
     if account is None:
         account = await create_account(
             user_name=user_name,
             pass_md5=pass_md5,
             utc_offset=utc_offset,
-            client_details=client_details,
             database_session=database_session,
         )
+    elif is_logged_in(account):
+        return login_failed("User is already logged in")
+
+    return await start_session(account, utc_offset, client_details)
+
 
-    cho_token = str(uuid.uuid1())
+async def start_session(
+    account: AccountRecord,
+    utc_offset: int,
+    client_details: ClientDetails,
+) -> LoginResult:
+    """Adds a session for an account that passed every login check."""
+    # the worker id prefix lets WorkerProxy route polls to the worker owning the session
+    cho_token = f"{common.bus.worker_id}:{uuid.uuid1()}"
+
+    try:
+        claimed = await common.bus.claim(cho_token, account.id, account.user_name)
+    except BusUnavailable:
+        return login_failed("Logins are unavailable right now, please try again.")
+
+    if not claimed:
+        return login_failed("User is already logged in")
+
+    record_client_details(account, client_details)
 
     session = Session(
         account=account.as_account_session(),
@@ -174,9 +284,7 @@ async def login_developer_mode(
     login_packets += packets.notification(config.InGameSettings.login_message)
 
     login_packets += packets.protocol_version()
-    login_packets += packets.bancho_privileges(
-        session.osu_client.server_to_client_privileges(session.privileges)
-    )
+    login_packets += packets.bancho_privileges(session.client_privileges)
     login_packets += packets.friends_list(session.account.friends)
 
     login_packets += packets.menu_icon(
@@ -204,11 +312,12 @@ async def login_developer_mode(
         login_packets += packets.channel_join(channel.name)
 
     user_data = packets.pack_osu_session(session)
-    common.sessions.send_to_all(user_data)
 
     login_packets += user_data
     login_packets += common.sessions.collect_all_sessions_for(session)
 
+    common.bus.publish(presence_topic(session.account.user_id), user_data)
+
     common.sessions.append(session)
 
     return LoginResult(
@@ -217,10 +326,11 @@ async def login_developer_mode(
     )
 
 
-async def login(request_body: bytes, database_session: DatabaseSession) -> LoginResult:
-    # TODO: finish checks and return proper packet structure
-    login_data = parse_login_data(request_body)
-
+async def login(
+    login_data: LoginData,
+    ip: Optional[str],
+    database_session: DatabaseSession,
+) -> LoginResult:
     if config.DeveloperSettings.create_account_on_login:
         return await login_developer_mode(
             user_name=login_data.user_name,
@@ -230,37 +340,52 @@ async def login(request_body: bytes, database_session: DatabaseSession) -> Login
             database_session=database_session,
         )
 
-    query = select(database_models.Account).where(
-        database_models.Account.user_name == login_data.user_name
-    )
-    account = database_session.exec(query).first()
+    account = await get_account_from_user_name(login_data.user_name, database_session)
 
     if account is None:
-        return {
-            "packets": (
-                packets.user_id(-1) + packets.notification("user doesn't exist")
-            ),
-            "cho_token": "no",
-        }
+        return login_failed("user doesn't exist")
 
-    if common.sessions.get_from_user_id(account.id):
-        return {
-            "packets": (
-                packets.user_id(-1) + packets.notification("User is already logged in")
-            ),
-            "cho_token": "no",
-        }
-
-    is_correct = argon2.verify(login_data.pass_md5, account.pass_argon2)
-    if not is_correct:
-        return {
-            "packets": (
-                packets.user_id(-1) + packets.notification("Password is incorrect")
-            ),
-            "cho_token": "no",
-        }
+    if is_logged_in(account):
+        return login_failed("User is already logged in")
+
+    # only wrong passwords count, a client retrying through a restart is fine
+    limit_key = (ip, utils.normalize_user_name(login_data.user_name))
+    if common.limits.LOGIN_USER_NAME.exhausted(limit_key):
+        return login_failed("Too many login attempts, please try again later.")
+
+    # a client reconnecting with the same password skips argon2
+    if not common.credentials.verified(account, login_data.pass_md5):
+        is_correct = await asyncio.to_thread(
+            argon2.verify, login_data.pass_md5, account.pass_argon2
+        )
+        if not is_correct:
+            common.limits.LOGIN_USER_NAME.charge(limit_key)
+            return login_failed("Password is incorrect")
 
-    breakpoint()
+        common.credentials.add(account, login_data.pass_md5)
+
+    return await start_session(
+        account, login_data.utc_offset, login_data.client_details
+    )
+
+
+LOGIN_RATE_LIMITED = packets.user_id(-1) + packets.notification(
+    "Too many login attempts, please try again later."
+)
+
+
+def client_ip(request: Request) -> Optional[str]:
+    if request.client is None:
+        return None
+
+    ip = request.client.host
+
+    # behind nginx the client's address is in X-Real-IP,
+    # anyone else could put whatever they like there
+    if ip in common.limits.TRUSTED_PROXIES:
+        return request.headers.get("X-Real-IP", ip)
+
+    return ip
 
 
 @bancho_router.get("/")
@@ -270,7 +395,8 @@ async def bancho_http_handler():
             [
                 "B a n c h o S e r v i c e",
                 "",
-                f"online users: {len(common.sessions)}",
+                # every worker's users, the proxy sends this to any of them
+                f"online users: {len(common.bus.directory)}",
             ]
         )
     )
@@ -284,15 +410,49 @@ async def bancho_handler(
     database_session: DatabaseSession = Depends(get_database_session),
 ):
     if osu_token is None:
-        async with common.locks.LOGIN:
-            login_data = await login(
-                request_body=await request.body(),
-                database_session=database_session,
+        ip = client_ip(request)
+
+        if not common.limits.LOGIN_IP.allow(ip):
+            return Response(
+                content=LOGIN_RATE_LIMITED,
+                headers={
+                    "cho-token": "no",
+                },
+            )
+
+        request_body = await request.body()
+
+        try:
+            async with common.locks.LOGIN_ADMISSION():
+                login_data = parse_login_data(request_body)
+
+                # only logins for the same user name are serialized,
+                # which is all that's needed to prevent double logins
+                async with common.locks.LOGIN(
+                    utils.normalize_user_name(login_data.user_name)
+                ):
+                    operation_id = common.monitor.WATCHDOG.begin(
+                        "login", "LOGIN", login_data.user_name
+                    )
+                    try:
+                        login_result = await login(
+                            login_data=login_data,
+                            ip=ip,
+                            database_session=database_session,
+                        )
+                    finally:
+                        common.monitor.WATCHDOG.end(operation_id)
+        except AdmissionRejected:
+            # tell the client to try again later, without doing any work
+            login_result = LoginResult(
+                packets=packets.system_restart(common.locks.LOGIN_RETRY_DELAY),
+                cho_token="no",
             )
+
         return Response(
-            content=login_data["packets"],
+            content=login_result["packets"],
             headers={
-                "cho-token": login_data["cho_token"],
+                "cho-token": login_result["cho_token"],
             },
         )
 
@@ -308,6 +468,9 @@ async def bancho_handler(
     if session.osu_client.pending_packets:
         pending_packets += session.osu_client.clear_pending_packets()
 
+    if session.spectating is not None:
+        pending_packets += read_spectate_frames(session)
+
     client_packets = await request.body()
 
     for packet in packets.read_packets(client_packets):
@@ -319,7 +482,19 @@ async def bancho_handler(
             if packet.data is not None:
                 args.append(packet.data)
 
-            packet_response = await packet_handlers[packet.id](*args) or b""
+            operation_id = common.monitor.WATCHDOG.begin(
+                "packet", packet.id.name, session.account.user_name
+            )
+            started = time.perf_counter()
+            try:
+                packet_response = await packet_handlers[packet.id](*args) or b""
+            except Exception:
+                metrics.HANDLED.errors[packet.id] += 1
+                raise
+            finally:
+                metrics.HANDLED.observe(packet.id, time.perf_counter() - started)
+                common.monitor.WATCHDOG.end(operation_id)
+
             if packet_response is None:
                 continue
 
@@ -355,9 +530,9 @@ async def change_action(
     session.osu_client.status.mode = action.mode
     session.osu_client.status.map_id = action.map_id
 
-    common.sessions.send_to_all(
-        packets.pack_osu_session(session),
-    )
+    user_data = packets.pack_osu_session(session)
+
+    common.bus.publish(presence_topic(session.account.user_id), user_data)
 
     return None
 
@@ -374,8 +549,8 @@ async def user_stats_request(
     if sessions is None:
         return None
 
-    for session in sessions:
-        all_users_stats += packets.pack_osu_session_stats(session)
+    for user_session in sessions:
+        all_users_stats += packets.pack_osu_session_stats(user_session)
 
     session.osu_client.pending_packets += all_users_stats
 
@@ -418,30 +593,37 @@ async def send_public_message(
     )
 
     # TODO: check if users blocked you
-    common.sessions.send_to_all_but(
-        excluded=[session],
-        data=message_packet,
+    common.bus.publish(
+        channel_topic(channel.name),
+        message_packet,
+        excluded_token=session.cho_token,
     )
     return None
 
 
 @packet_handler(ClientPackets.SEND_PRIVATE_MESSAGE)
 async def send_private_message(session: Session, message: packets.Message) -> None:
-    target_session = common.sessions.get_from_user_name(message.reciever)
+    # the target may be online in another worker
+    target = common.bus.directory.get_from_user_name(message.reciever)
 
-    if target_session is None:
+    if target is None:
         session.osu_client.notify(f"{message.reciever} isn't online")
         return None
 
-    if target_session.is_bot:
+    target_session = common.sessions.get_from_token(target.token)
+
+    if target_session is not None and target_session.is_bot:
         # TODO: process commands
         return None
     else:
-        target_session.osu_client.pending_packets += packets.send_message(
-            senders_name=session.account.user_name,
-            message=message.text,
-            target_channel_or_user=message.reciever,
-            sender_user_id=session.account.user_id,
+        common.bus.publish(
+            user_topic(target.user_id),
+            packets.send_message(
+                senders_name=session.account.user_name,
+                message=message.text,
+                target_channel_or_user=message.reciever,
+                sender_user_id=session.account.user_id,
+            ),
         )
 
 
@@ -473,6 +655,12 @@ async def logout(
         return None
 
     common.sessions.remove(session)
+    common.bus.unregister(session.cho_token)
+
+    leave_match(session)
+    common.lobby.remove(session)
+    leave_spectating(session)
+    dispose_spectators(session)
 
     for channel in common.channels:
         if session not in channel:
@@ -480,11 +668,77 @@ async def logout(
 
         session.leave_channel(channel)
 
-    for other_session in common.sessions:
-        if other_session.account.user_id in other_session.account.friends:
-            session.osu_client.pending_packets += packets.logout(
-                other_session.account.user_id
-            )
+    # the logout drops the cached account in every worker,
+    # the next login reads the friends from the database
+    await common.queues.FRIENDSHIPS.flush_pending()
+
+    common.bus.publish(
+        logout_topic(session.account.user_id),
+        packets.logout(session.account.user_id),
+    )
+
+    return None
+
+
+def account_exists(user_id: int) -> bool:
+    if common.bus.directory.get_from_user_id(user_id) is not None:
+        return True
+
+    if common.accounts.get_from_user_id(user_id) is not None:
+        return True
+
+    with DatabaseSession(common.database.engine) as database_session:
+        return database_session.get(database_models.Account, user_id) is not None
+
+
+@packet_handler(ClientPackets.FRIEND_ADD)
+async def friend_add(session: Session, user_id: int) -> None:
+    if user_id == session.account.user_id:
+        return None
+
+    if user_id in session.account.friends:
+        return None
+
+    if len(session.account.friends) >= common.limits.MAX_FRIENDS:
+        session.osu_client.notify(
+            f"You can't have more than {common.limits.MAX_FRIENDS} friends."
+        )
+        # the client already shows them as a friend
+        session.osu_client.pending_packets += packets.friends_list(
+            session.account.friends
+        )
+        return None
+
+    if not account_exists(user_id):
+        return None
+
+    session.account.friends.add(user_id)
+
+    common.queues.FRIENDSHIPS.put(
+        FriendshipChange(
+            user_id=session.account.user_id,
+            friend_id=user_id,
+            added=True,
+        )
+    )
+
+    return None
+
+
+@packet_handler(ClientPackets.FRIEND_REMOVE)
+async def friend_remove(session: Session, user_id: int) -> None:
+    if user_id not in session.account.friends:
+        return None
+
+    session.account.friends.remove(user_id)
+
+    common.queues.FRIENDSHIPS.put(
+        FriendshipChange(
+            user_id=session.account.user_id,
+            friend_id=user_id,
+            added=False,
+        )
+    )
 
     return None
 
@@ -511,7 +765,7 @@ async def channel_join(session: Session, channel_name: str) -> None:
     channel = common.channels.get_from_name(channel_name)
 
     if channel is None:
-        if channel_name.startswith("#match_"):
+        if channel_name.startswith(("#match_", "#spec_")):
             session.osu_client.leave_channel_from_name(channel_name)
         else:
             session.osu_client.notify(f"{channel_name} doesn't exist")
@@ -535,17 +789,16 @@ async def join_lobby(session: Session) -> None:
         if session not in lobby_channel:
             session.join_channel(lobby_channel)
 
-    for match in common.matches:
-        if match is None:
-            continue
-
-        session.osu_client.see_match(match)
+    common.lobby.add(session)
+    session.osu_client.pending_packets += common.matches.lobby_listing()
 
     return None
 
 
 @packet_handler(ClientPackets.PART_LOBBY)
 async def part_lobby(session: Session) -> None:
+    common.lobby.remove(session)
+
     lobby_channel = common.channels.get_from_name("#lobby")
 
     assert lobby_channel, "#lobby was not found"
@@ -558,30 +811,222 @@ async def part_lobby(session: Session) -> None:
     return None
 
 
+def match_updated(match: Match) -> None:
+    """Sends the match's new settings and slots to the lobby and its players."""
+    common.matches.changed(match)
+
+    common.bus.publish(LOBBY_TOPIC, packets.update_match(match, send_pass_word=False))
+    common.bus.publish(
+        match_topic(match.id), packets.update_match(match, send_pass_word=True)
+    )
+
+
 @packet_handler(ClientPackets.CREATE_MATCH)
 async def create_match(session: Session, match_packet: packets.Match) -> None:
-    match_id = len(common.matches) + 1
-
-    match = Match.from_match_packet(match_packet, match_id)
+    match_id = common.matches.get_free_id()
 
-    try:
-        common.matches.add(match)
-    except:
+    if match_id is None:
         session.osu_client.notify("No slots available for this match.")
         session.osu_client.joining_match_failed()
         return None
 
+    match = Match.from_match_packet(match_packet, match_id)
+
+    # the client sends its own id as the host, don't trust it
+    match.host_id = session.account.user_id
+    match.in_progress = False
+
+    common.matches.add(match)
+
     # create channel for multiplayer match
     channel = match.init_channel()
     common.channels.add(channel)
 
     # have the session join the match
     session.join_match(match, match.pass_word)
+    common.lobby.remove(session)
+
+    common.bus.publish(LOBBY_TOPIC, packets.new_match(match))
+
+
+@packet_handler(ClientPackets.JOIN_MATCH)
+async def join_match(session: Session, join: packets.JoinMatch) -> None:
+    match = common.matches.get_from_id(join.match_id)
+
+    if match is None or session.match is not None:
+        session.osu_client.joining_match_failed()
+        return None
+
+    session.join_match(match, join.pass_word or None)
+
+    if session.match is match:
+        # the client joins the lobby again when it leaves
+        common.lobby.remove(session)
+        match_updated(match)
+
+
+def leave_match(session: Session) -> None:
+    match = session.match
+
+    if match is None:
+        return None
+
+    host_id = match.host_id
+    session.leave_match()
+
+    if match.is_empty:
+        dispose_match(match)
+        return None
+
+    if match.host_id != host_id:
+        common.bus.publish(user_topic(match.host_id), packets.match_transfer_host())
+
+    # the rest may have only been waiting on this player
+    updated = False
+
+    for barrier in BARRIERS:
+        if match.release(barrier):
+            barrier_released(match, barrier)
+            updated = updated or barrier == COMPLETED
+
+    if not updated:
+        match_updated(match)
+
+
+def dispose_match(match: Match) -> None:
+    # frees the id and channel name for the next match
+    common.matches.remove(match)
+    common.channels.remove(match.channel)
+
+    common.bus.publish(LOBBY_TOPIC, packets.dispose_match(match.id))
 
 
 @packet_handler(ClientPackets.PART_MATCH)
 async def part_match(session: Session) -> None:
-    session.leave_match()
+    leave_match(session)
+
+
+@packet_handler(ClientPackets.MATCH_START)
+async def match_start(session: Session) -> None:
+    match = session.match
+
+    if match is None or match.host_id != session.account.user_id:
+        return None
+
+    if match.in_progress:
+        return None
+
+    if not match.start():
+        session.osu_client.notify("Nobody in the match has the map.")
+        return None
+
+    common.bus.publish(match_topic(match.id), packets.match_start(match))
+    match_updated(match)
+
+
+def barrier_released(match: Match, barrier: int) -> None:
+    """Everyone playing got past `barrier`, see `Match.arrive`.
+
+    Sends the match's update too once it's completed."""
+    if barrier == LOADED:
+        common.bus.publish(match_topic(match.id), packets.match_all_players_loaded())
+    elif barrier == SKIPPED:
+        common.bus.publish(match_topic(match.id), packets.match_skip())
+    else:
+        # the client expects MATCH_COMPLETE before the match's slots go back
+        common.bus.publish(match_topic(match.id), packets.match_complete())
+        match.finish()
+        match_updated(match)
+
+
+def arrive(session: Session, barrier: int) -> Optional[int]:
+    """The session's slot id, if it's playing in its match."""
+    match = session.match
+
+    if match is None:
+        return None
+
+    slot_id = match.user_slots.get(session.account.user_id)
+
+    if slot_id is None:
+        return None
+
+    if match.arrive(barrier, slot_id):
+        barrier_released(match, barrier)
+
+    return slot_id
+
+
+@packet_handler(ClientPackets.MATCH_LOAD_COMPLETE)
+async def match_load_complete(session: Session) -> None:
+    arrive(session, LOADED)
+
+
+@packet_handler(ClientPackets.MATCH_SKIP_REQUEST)
+async def match_skip_request(session: Session) -> None:
+    match = session.match
+
+    if match is None or session.account.user_id not in match.user_slots:
+        return None
+
+    # before the barrier, so the last skip is shown before everyone skips
+    common.bus.publish(
+        match_topic(match.id),
+        packets.match_player_skipped(session.account.user_id),
+    )
+
+    arrive(session, SKIPPED)
+
+
+@packet_handler(ClientPackets.MATCH_COMPLETE)
+async def match_complete(session: Session) -> None:
+    match = session.match
+
+    if match is None:
+        return None
+
+    slot_id = match.user_slots.get(session.account.user_id)
+
+    if slot_id is not None and match.in_progress:
+        match.slot_statuses[slot_id] = SlotStatus.COMPLETE
+        common.matches.changed(match)
+
+    arrive(session, COMPLETED)
+
+
+@packet_handler(ClientPackets.MATCH_FAILED)
+async def match_failed(session: Session) -> None:
+    match = session.match
+
+    if match is None:
+        return None
+
+    slot_id = match.user_slots.get(session.account.user_id)
+
+    if slot_id is None:
+        return None
+
+    common.bus.publish(match_topic(match.id), packets.match_player_failed(slot_id))
+
+
+@packet_handler(ClientPackets.MATCH_SCORE_UPDATE)
+async def match_score_update(session: Session, score_frame: bytes) -> None:
+    match = session.match
+
+    if match is None:
+        return None
+
+    slot_id = match.user_slots.get(session.account.user_id)
+
+    if slot_id is None or len(score_frame) <= packets.SCORE_FRAME_SLOT_ID:
+        return None
+
+    # sent many times a second by every player, it's never decoded
+    common.bus.publish(
+        match_topic(match.id),
+        packets.match_score_update(score_frame, slot_id),
+        excluded_token=session.cho_token,
+    )
 
 
 @packet_handler(ClientPackets.MATCH_CHANGE_SETTINGS)
@@ -589,10 +1034,135 @@ async def change_settings(
     session: Session,
     match_packet: packets.Match,
 ) -> None:
-    new_match = Match.from_match_packet(match_packet)
+    match = session.match
+
+    if match is None or match.host_id != session.account.user_id:
+        return None
+
+    new_match = Match.from_match_packet(match_packet, match.id)
+
+    match.name = new_match.name
+    match.pass_word = new_match.pass_word
+    match.free_mod = new_match.free_mod
+    match.mods = new_match.mods
+    match.game_mode = new_match.game_mode
+    match.win_condition = new_match.win_condition
+    match.team_type = new_match.team_type
+
+    if new_match.current_map.md5 != match.current_map.md5:
+        match.previous_map = match.current_map
+        match.current_map = new_match.current_map
+
+    match_updated(match)
+
+
+@packet_handler(ClientPackets.START_SPECTATING)
+async def start_spectating(session: Session, host_id: int) -> None:
+    host = common.sessions.get_from_user_id(host_id)
+
+    if host is None:
+        # offline, or in another worker, frames are only relayed within one
+        entry = common.bus.directory.get_from_user_id(host_id)
+        host_name = entry.user_name if entry is not None else "That player"
+
+        session.osu_client.notify(f"{host_name} can't be spectated right now.")
+        return None
+
+    if host is session or host.is_bot:
+        return None
+
+    if session.spectating is host:
+        return None
+
+    leave_spectating(session)
 
-    if session.match is None:
+    if host.spectator_channel is None:
+        channel = Channel(
+            name=f"#spec_{host.account.user_id}",
+            description=f"Spectating {host.account.user_name}",
+            auto_join=False,
+        )
+        common.channels.add(channel)
+
+        host.spectator_channel = channel
+        host.join_channel(channel)
+
+    host.add_spectator(session)
+    common.frame_relay.add_spectator(host.cho_token, session.cho_token)
+
+
+def leave_spectating(session: Session) -> None:
+    host = session.spectating
+
+    if host is None:
         return None
 
-    breakpoint()
-    # TODO: run checks and test with another account
+    host.remove_spectator(session)
+    common.frame_relay.remove_spectator(host.cho_token, session.cho_token)
+
+    if not host.spectators:
+        dispose_spectators(host)
+
+
+def dispose_spectators(host: Session) -> None:
+    """Stops everyone spectating `host` and removes its spectator channel."""
+    for spectator in list(host.spectators.values()):
+        host.remove_spectator(spectator)
+
+    common.frame_relay.remove_host(host.cho_token)
+
+    channel = host.spectator_channel
+
+    if channel is None:
+        return None
+
+    host.spectator_channel = None
+    host.leave_channel(channel)
+    common.channels.remove(channel)
+
+
+@packet_handler(ClientPackets.STOP_SPECTATING)
+async def stop_spectating_handler(session: Session) -> None:
+    leave_spectating(session)
+
+
+@packet_handler(ClientPackets.SPECTATE_FRAMES)
+async def spectate_frames(session: Session, frames: bytes) -> None:
+    if not session.spectators:
+        return None
+
+    # sent many times a second, one packet is built and shared by every spectator
+    common.frame_relay.relay(session.cho_token, packets.spectate_frames(frames))
+
+
+def read_spectate_frames(session: Session) -> bytes:
+    host = session.spectating
+    assert host is not None
+
+    data, resynced = common.frame_relay.read(host.cho_token, session.cho_token)
+
+    if resynced:
+        # it can't keep up, the host sees it like a spectator missing the map
+        cant_spectate = packets.spectator_cant_spectate(session.account.user_id)
+        host.osu_client.pending_packets += cant_spectate
+
+        for spectator in host.spectators.values():
+            if spectator is not session:
+                spectator.osu_client.pending_packets += cant_spectate
+
+    return data
+
+
+@packet_handler(ClientPackets.CANT_SPECTATE)
+async def cant_spectate(session: Session) -> None:
+    host = session.spectating
+
+    if host is None:
+        return None
+
+    data = packets.spectator_cant_spectate(session.account.user_id)
+    host.osu_client.pending_packets += data
+
+    for spectator in host.spectators.values():
+        if spectator is not session:
+            spectator.osu_client.pending_packets += data
@@ -1,17 +1,50 @@
-from enums.game_mode import GameMode
+import string
+
+from enums.game_mode import (
+    CLIENT_MODE_TO_AUTOPILOT_MODE,
+    CLIENT_MODE_TO_RELAX_MODE,
+    MODE_TO_CLIENT_MODE,
+)
 from enums.mods import Mods
 
+RELAX = Mods.RELAX.value
+AUTOPILOT = Mods.AUTOPILOT.value
+
+ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
 
-def ensure_mods_and_gamemode(mods: int, game_mode: int) -> tuple[Mods, GameMode]:
-    if mods & Mods.RELAX:
-        if game_mode == GameMode.vn_mania:
-            mods &= ~Mods.RELAX
+def normalize_mods_and_mode(mods: int, game_mode: int) -> tuple[int, int]:
+    """The client's mods and game mode, as plain ints, in our game modes:
+    relax and autopilot get their own, or are dropped where they don't exist."""
+    if not 0 <= game_mode <= 3:
+        raise ValueError(f"{game_mode} is not a valid osu! client game mode")
+
+    if mods & RELAX:
+        relax_mode = CLIENT_MODE_TO_RELAX_MODE[game_mode]
+
+        if relax_mode is None:
+            mods &= ~RELAX
         else:
-            game_mode += 4
-    elif mods & Mods.AUTOPILOT:
-        if game_mode in (GameMode.vn_taiko, GameMode.vn_catch, GameMode.vn_mania):
-            mods &= ~Mods.AUTOPILOT
+            game_mode = relax_mode
+    elif mods & AUTOPILOT:
+        autopilot_mode = CLIENT_MODE_TO_AUTOPILOT_MODE[game_mode]
+
+        if autopilot_mode is None:
+            mods &= ~AUTOPILOT
         else:
-            game_mode += 8
+            game_mode = autopilot_mode
+
+    return mods, game_mode
+
+
+def client_mode(game_mode: int) -> int:
+    return MODE_TO_CLIENT_MODE[game_mode]
+
+
+def normalize_user_name(user_name: str) -> str:
+    """Folds only ascii letters, like sqlite's lower(), which the unique
+    `lower(user_name)` index and account lookups use."""
+    if user_name.isascii():
+        return user_name.lower()
 
-    return Mods(mods), GameMode(game_mode)
+    return user_name.translate(ASCII_LOWER)